@@ -0,0 +1,167 @@
+"""
+Archives - streamed ZIP of multi-item posts
+The items of a picker result (carousel photos, multi-media tweets) are
+downloaded concurrently on the pooled client and written into one ZIP as
+their bytes arrive: no temp files, and memory bounded by
+ZIP_FETCH_CONCURRENCY read-ahead queues of ZIP_QUEUE_CHUNKS chunks each
+"""
+
+import asyncio
+import re
+import time
+import unicodedata
+import zipfile
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import quote
+import config
+from http_client import get_client
+
+# Extension from the response's Content-Type, when it names a media type
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+    'video/mp4': 'mp4',
+    'video/webm': 'webm',
+    'video/quicktime': 'mov',
+}
+
+UNSAFE_FILENAME = re.compile(r'[^\w\- .]+')
+
+
+class _Sink:
+    """
+    Write-only file object for zipfile: it cannot tell() or seek(), so
+    zipfile streams (sizes and CRCs go in data descriptors) and everything
+    written is collected until the response takes it
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def archive_name(title: Optional[str]) -> str:
+    """Download filename for a post's archive"""
+    name = UNSAFE_FILENAME.sub("", title or "").strip()[:80]
+    return f"{name or 'media'}.zip"
+
+
+def content_disposition(title: Optional[str]) -> str:
+    """
+    Content-Disposition for the archive: an ASCII filename (headers are
+    latin-1) plus the full Unicode one as RFC 5987 filename*
+    """
+    name = archive_name(title)
+    fallback = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    fallback = archive_name(" ".join(fallback[:-len(".zip")].split()))
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(name)}"
+
+
+def _entry_name(index: int, item: Dict, content_type: str) -> str:
+    ext = CONTENT_TYPE_EXTENSIONS.get(content_type.split(';')[0].strip().lower()) or item.get('ext') or 'bin'
+    return f"{index + 1:02d}.{ext}"
+
+
+def _reason(error: Exception) -> str:
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return f"HTTP {response.status_code}"
+    return str(error) or type(error).__name__
+
+
+async def _fetch(url: str, queue: asyncio.Queue):
+    """
+    Download url into queue: the response headers first, then its chunks,
+    then None (or the exception that stopped it). put() blocks while the
+    queue is full, so an item never reads further ahead than the queue.
+    """
+    try:
+        headers = {"User-Agent": config.USER_AGENTS[0]}
+        async with get_client().stream("GET", url, headers=headers) as response:
+            response.raise_for_status()
+            await queue.put(response.headers)
+            async for chunk in response.aiter_bytes(config.ZIP_CHUNK_SIZE):
+                await queue.put(chunk)
+        await queue.put(None)
+    except Exception as e:
+        await queue.put(e)
+
+
+async def stream_zip(items: List[Dict]) -> AsyncIterator[bytes]:
+    """
+    Yield a ZIP of items ({"url", "ext", ...}) while they download
+
+    Entries are written in order, so item N is streamed as soon as its
+    bytes come in while the next ZIP_FETCH_CONCURRENCY - 1 items read
+    ahead. Media is stored uncompressed (it already is compressed). An
+    item that fails is left out, or cut short when it fails halfway, and
+    listed in errors.txt at the end of the archive.
+    """
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+    queues = [asyncio.Queue(maxsize=config.ZIP_QUEUE_CHUNKS) for _ in items]
+    fetches: Dict[int, asyncio.Task] = {}
+    errors: List[str] = []
+    written = 0
+    started = time.monotonic()
+
+    def start(index: int):
+        if index < len(items):
+            fetches[index] = asyncio.create_task(_fetch(items[index]['url'], queues[index]))
+
+    for index in range(config.ZIP_FETCH_CONCURRENCY):
+        start(index)
+
+    try:
+        for index, item in enumerate(items):
+            queue = queues[index]
+            headers = await queue.get()
+            if isinstance(headers, Exception):
+                errors.append(f"{index + 1}: not downloaded ({_reason(headers)})")
+            else:
+                info = zipfile.ZipInfo(_entry_name(index, item, headers.get('content-type', '')),
+                                       time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                length = headers.get('content-length')
+                if length and length.isdigit():
+                    info.file_size = int(length)  # lets zipfile decide on ZIP64 up front
+                # Unknown length: ZIP64 fields, in case it turns out to be over 4 GB
+                with archive.open(info, 'w', force_zip64=info.file_size == 0) as entry:
+                    while True:
+                        chunk = await queue.get()
+                        if chunk is None:
+                            break
+                        if isinstance(chunk, Exception):
+                            errors.append(f"{index + 1}: incomplete ({_reason(chunk)})")
+                            break
+                        entry.write(chunk)
+                        written += len(chunk)
+                        yield sink.drain()
+                yield sink.drain()
+
+            fetches.pop(index, None)
+            start(index + config.ZIP_FETCH_CONCURRENCY)
+
+        if errors:
+            archive.writestr("errors.txt", "\n".join(errors) + "\n")
+        archive.close()
+        yield sink.drain()
+        print(f"✓ ZIP sent: {len(items) - len(errors)}/{len(items)} items, "
+              f"{written / 1024 / 1024:.1f} MB in {time.monotonic() - started:.1f}s")
+    finally:
+        for task in fetches.values():
+            task.cancel()
+        await asyncio.gather(*fetches.values(), return_exceptions=True)
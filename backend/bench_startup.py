@@ -0,0 +1,111 @@
+"""
+Startup-time benchmark for both apps
+Measures `import main` with `python -X importtime` and fails when an app
+goes over its budget or eagerly loads a module that must stay lazy
+
+Usage:
+    python bench_startup.py                     # backend + hf_deploy
+    python bench_startup.py --app ../hf_deploy --budget-ms 900 --runs 7
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_APPS = [HERE, os.path.join(HERE, "..", "hf_deploy")]
+
+# Budget for `import main` (cumulative import time, median of all runs)
+DEFAULT_BUDGET_MS = 1200
+
+# Heavy modules that must only load on first use
+LAZY_MODULES = ("yt_dlp", "requests", "httpx")
+
+
+def measure(app_dir: str) -> Tuple[float, Dict[str, int], List[str]]:
+    """
+    Import the app once in a fresh interpreter
+
+    Returns (import time of main in ms, direct imports of main in us, every module loaded)
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=app_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import main failed in {app_dir}:\n{proc.stderr[-2000:]}")
+
+    loaded: List[str] = []
+    children: Dict[str, int] = {}
+    main_children: Dict[str, int] = {}
+    main_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, field = line[len("import time:"):].split("|")
+        name = field.strip()
+        # Nesting is encoded as two extra spaces per level; children print before their parent
+        depth = (len(field) - len(field.lstrip(" ")) - 1) // 2
+        loaded.append(name)
+        if depth == 1:
+            children[name] = children.get(name, 0) + int(cumulative)
+        elif depth == 0:
+            if name == "main":
+                main_us, main_children = int(cumulative), children
+            children = {}
+
+    return main_us / 1000, main_children, loaded
+
+
+def bench(app_dir: str, runs: int) -> Tuple[float, List[Tuple[str, int]], List[str]]:
+    totals = []
+    children: Dict[str, int] = {}
+    loaded: List[str] = []
+    for _ in range(runs):
+        total_ms, children, loaded = measure(app_dir)
+        totals.append(total_ms)
+
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    heaviest = sorted(children.items(), key=lambda item: item[1], reverse=True)[:8]
+    return statistics.median(totals), heaviest, eager
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Startup import-time benchmark")
+    parser.add_argument("--app", action="append", help="App directory containing main.py (repeatable)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for app_dir in args.app or DEFAULT_APPS:
+        app_dir = os.path.normpath(app_dir)
+        median_ms, heaviest, eager = bench(app_dir, args.runs)
+
+        print(f"\n{app_dir}")
+        print(f"  import main: {median_ms:.0f} ms (median of {args.runs}, budget {args.budget_ms:.0f} ms)")
+        for name, us in heaviest:
+            print(f"    {us / 1000:8.1f} ms  {name}")
+
+        if median_ms > args.budget_ms:
+            print(f"  ✗ over budget by {median_ms - args.budget_ms:.0f} ms")
+            failed = True
+        if eager:
+            print(f"  ✗ loaded at import time: {', '.join(eager)}")
+            failed = True
+        if median_ms <= args.budget_ms and not eager:
+            print("  ✓ within budget")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+Bulk extraction for catalog jobs
+Runs a list of URLs through VideoExtractorManager directly (no HTTP
+server) and writes one JSON line per URL in completion order
+
+URLs whose primary extractor is Cobalt run as async tasks in this
+process; yt-dlp-first URLs (YouTube, Facebook, ...) go to worker
+processes with their own manager, since yt-dlp extraction is CPU-bound
+Python. URLs are canonicalized and deduplicated first. The output file
+is the checkpoint: --resume appends to it and skips URLs already in it,
+except failures that may be transient (timeouts, rate limits, ...): those
+run again and their new line follows the old one.
+
+Usage:
+    python bulk_extract.py urls.txt -o results.jsonl
+    cat urls.txt | python bulk_extract.py -o results.jsonl --cobalt-concurrency 16 --ytdlp-workers 4
+    python bulk_extract.py urls.txt -o results.jsonl --resume
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, TextIO, Tuple
+import config
+from deadline import Deadline
+from extractors import FAILURE_PATTERNS, VideoExtractorManager, ExtractionError, classify_error
+from urls import canonicalize_url, is_playlist_url
+
+# Seconds between progress lines on stderr
+PROGRESS_INTERVAL = 10
+
+
+def read_urls(source: TextIO) -> Iterable[str]:
+    """Non-empty, non-comment lines"""
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def is_final(record: Dict) -> bool:
+    """Whether a result line settles its URL: a success or a deterministic failure"""
+    return record.get("status") == "ok" or record.get("kind") in FAILURE_PATTERNS
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Canonical URLs a previous run's output settled (see is_final)"""
+    done: Set[str] = set()
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if is_final(record):
+                        done.add(record["url"])
+                except (ValueError, KeyError):
+                    continue  # a line cut short by an interrupted run
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def plan(urls: Iterable[str], done: Set[str]) -> Tuple[List[Tuple[str, str]], Counter]:
+    """(input URL, canonical URL) pairs still to extract, and what was skipped"""
+    skipped: Counter = Counter()
+    seen: Set[str] = set()
+    todo: List[Tuple[str, str]] = []
+    for url in urls:
+        if not url.startswith(('http://', 'https://')):
+            skipped["invalid"] += 1
+            continue
+        canonical = canonicalize_url(url)
+        if canonical in seen:
+            skipped["duplicate"] += 1
+        elif canonical in done:
+            skipped["checkpoint"] += 1
+        else:
+            todo.append((url, canonical))
+        seen.add(canonical)
+    return todo, skipped
+
+
+async def extract_one(manager: VideoExtractorManager, url: str, budget: float) -> Dict:
+    """Result line for one canonical URL (never raises)"""
+    started = time.monotonic()
+    record: Dict = {"url": url}
+    try:
+        if is_playlist_url(url):
+            raise ExtractionError("Playlist or channel URL; list it with /api/playlist", kind="unsupported")
+        record["result"] = await manager.extract(url, Deadline(budget))
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+        record["kind"] = (getattr(e, "kind", None) or classify_error(str(e))
+                          or ("transient" if isinstance(e, ExtractionError) else type(e).__name__))
+    record["elapsed"] = round(time.monotonic() - started, 3)
+    return record
+
+
+# yt-dlp worker processes: one manager and one event loop each, kept for
+# the life of the process so the pooled HTTP client stays on its loop
+_worker_manager: Optional[VideoExtractorManager] = None
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _init_worker(verbose: bool, hedge: bool):
+    global _worker_manager, _worker_loop
+    # Spawned workers import config afresh; apply the parent's settings again
+    config.HEDGE_ENABLED = hedge
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+    _worker_manager = VideoExtractorManager()
+    _worker_loop = asyncio.new_event_loop()
+
+
+def _extract_in_worker(url: str, budget: float) -> Dict:
+    return _worker_loop.run_until_complete(extract_one(_worker_manager, url, budget))
+
+
+class BulkRun:
+    """One bulk job: scheduling across both lanes, output and statistics"""
+
+    def __init__(self, args: argparse.Namespace, out: TextIO):
+        self.args = args
+        self.out = out
+        self.manager = VideoExtractorManager()
+        self.counts: Counter = Counter()
+        self.latencies: Dict[str, List[float]] = {"async": [], "process": []}
+        self.started = time.monotonic()
+        self._last_progress = self.started
+        self.total = 0
+
+    def lane(self, url: str) -> str:
+        platform = self.manager.detect_platform(url)
+        if self.args.ytdlp_workers and not self.manager.cobalt_first(platform):
+            return "process"
+        return "async"
+
+    def write(self, input_url: str, lane: str, record: Dict):
+        if input_url != record["url"]:
+            record["input"] = input_url
+        record["lane"] = lane
+        self.out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.out.flush()
+
+        self.counts[record["status"]] += 1
+        if record["status"] == "error":
+            self.counts[f"error:{record['kind']}"] += 1
+        self.latencies[lane].append(record["elapsed"])
+        self.progress()
+
+    def progress(self, final: bool = False):
+        now = time.monotonic()
+        if not final and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        finished = self.counts["ok"] + self.counts["error"]
+        rate = finished / max(now - self.started, 1e-6)
+        print(f"  {finished}/{self.total} done, {self.counts['error']} failed, {rate:.2f} URLs/s", file=sys.stderr)
+
+    async def run(self, todo: List[Tuple[str, str]]):
+        self.total = len(todo)
+        loop = asyncio.get_running_loop()
+        cobalt_slots = asyncio.Semaphore(self.args.cobalt_concurrency)
+        # Enough queued per worker that none idles between results
+        ytdlp_slots = asyncio.Semaphore(max(1, self.args.ytdlp_workers * 2))
+        pool = None
+        if self.args.ytdlp_workers:
+            pool = ProcessPoolExecutor(
+                max_workers=self.args.ytdlp_workers,
+                # spawn: a fork would inherit this process's event loop and HTTP client
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.args.verbose, self.args.hedge),
+            )
+
+        async def async_job(input_url: str, url: str):
+            async with cobalt_slots:
+                record = await extract_one(self.manager, url, self.args.deadline)
+            self.write(input_url, "async", record)
+
+        async def process_job(input_url: str, url: str):
+            async with ytdlp_slots:
+                record = await loop.run_in_executor(pool, _extract_in_worker, url, self.args.deadline)
+            self.write(input_url, "process", record)
+
+        jobs = [
+            asyncio.create_task(process_job(*item) if self.lane(item[1]) == "process" else async_job(*item))
+            for item in todo
+        ]
+        try:
+            await asyncio.gather(*jobs)
+        finally:
+            for job in jobs:
+                job.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+            if pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def summary(self, skipped: Counter) -> str:
+        elapsed = time.monotonic() - self.started
+        finished = self.counts["ok"] + self.counts["error"]
+        lines = [
+            f"\n{finished}/{self.total} URLs in {elapsed:.1f}s ({finished / max(elapsed, 1e-6):.2f} URLs/s)",
+            f"  ok {self.counts['ok']}, failed {self.counts['error']}"
+            + "".join(f", {key[6:]} {n}" for key, n in sorted(self.counts.items()) if key.startswith("error:")),
+        ]
+        if skipped:
+            lines.append("  skipped: " + ", ".join(f"{reason} {n}" for reason, n in sorted(skipped.items())))
+        for lane, latencies in self.latencies.items():
+            if latencies:
+                latencies = sorted(latencies)
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                lines.append(f"  {lane}: {len(latencies)} URLs, median {statistics.median(latencies):.2f}s, p95 {p95:.2f}s")
+        return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Extract many URLs to JSONL without the HTTP server")
+    parser.add_argument("input", nargs="?", default="-", help="File with one URL per line (default: stdin)")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    parser.add_argument("--resume", action="store_true", help="Append to --output and skip URLs it already settled (transient failures run again)")
+    parser.add_argument("--cobalt-concurrency", type=int, default=8, help="Async extractions at once in this process")
+    parser.add_argument("--ytdlp-workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes for yt-dlp-first URLs (0 = run them as async tasks too)")
+    parser.add_argument("--deadline", type=float, default=config.REQUEST_DEADLINE, help="Seconds per URL")
+    parser.add_argument("--hedge", action="store_true", help="Keep request hedging on (doubles upstream load on slow URLs)")
+    parser.add_argument("--verbose", action="store_true", help="Show extractor logs on stderr")
+    args = parser.parse_args()
+
+    if args.resume and not args.output:
+        parser.error("--resume needs --output (the output file is the checkpoint)")
+    # Throughput over tail latency: no speculative second extraction per URL
+    config.HEDGE_ENABLED = args.hedge
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    with source:
+        done = load_checkpoint(args.output) if args.resume else set()
+        todo, skipped = plan(read_urls(source), done)
+
+    out = open(args.output, "a" if args.resume else "w") if args.output else sys.stdout
+    print(f"Extracting {len(todo)} URLs ({args.cobalt_concurrency} async, {args.ytdlp_workers} yt-dlp workers)",
+          file=sys.stderr)
+
+    run = BulkRun(args, out)
+    # Extractor logs go to stdout; keep them out of the results
+    logs = sys.stderr if args.verbose else open(os.devnull, "w")
+    interrupted = False
+    try:
+        with contextlib.redirect_stdout(logs):
+            asyncio.run(run.run(todo))
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    run.progress(final=True)
+    print(run.summary(skipped), file=sys.stderr)
+    if interrupted:
+        print("Interrupted; run again with --resume to continue", file=sys.stderr)
+        return 130
+    return 0 if run.counts["ok"] or not run.total else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
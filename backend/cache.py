@@ -0,0 +1,241 @@
+"""
+Caches - video info and deterministic extraction failures
+A video entry lives until its earliest-expiring format URL is about to die
+(minus a safety margin), and hot entries are refreshed ahead of that.
+Entries are stored packed and the video cache is bounded by bytes
+"""
+
+import sys
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+from cachetools import TLRUCache
+import config
+from urls import url_expiry
+
+# Marks a format's url slot whose value lives in the entry's URL blob
+_IN_BLOB = object()
+
+# Key layouts (("label", "quality", ...)) shared by every entry that uses them
+_layouts: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+def _layout(keys) -> Tuple[str, ...]:
+    keys = tuple(sys.intern(k) for k in keys)
+    return _layouts.setdefault(keys, keys)
+
+
+def _intern(value: Any) -> Any:
+    """Intern short repeated strings (labels, qualities, sizes, extensions)"""
+    if isinstance(value, str) and len(value) <= config.CACHE_INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+def _deep_size(obj: Any, seen: set) -> int:
+    """Bytes held by obj and everything it references (shared objects counted once)"""
+    if obj is None or isinstance(obj, bool) or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (tuple, list)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    return size
+
+
+def entry_ttl(data: Dict, now: float) -> float:
+    """Seconds an extraction result can be served before its links go stale (0: do not cache)"""
+    expiries = [url_expiry(f.get('url')) for f in data.get('formats', [])]
+    expiries = [e for e in expiries if e]
+    if not expiries:
+        return config.CACHE_TTL
+
+    remaining = min(expiries) - now  # life left of the first link to expire
+    if remaining < config.CACHE_MIN_TTL:
+        return 0  # dead or about to be: not worth caching at all
+    # The margin may give way to CACHE_MIN_TTL, the link's actual life never does
+    ttl = max(config.CACHE_MIN_TTL, remaining - config.CACHE_EXPIRY_MARGIN)
+    return min(ttl, remaining, config.CACHE_MAX_TTL)
+
+
+class CacheEntry:
+    """
+    One cached extraction result, packed, and its lifetime
+
+    The top-level fields and each format are (layout, values) pairs: key
+    names live once in a shared layout tuple and short values are interned.
+    Format URLs, the bulk of an entry, go into one newline-joined blob that
+    is zlib-compressed when CACHE_COMPRESS_URLS is on and it saves space.
+    data rebuilds the original dict (same key order) on every access.
+    """
+
+    __slots__ = ('head', 'formats', 'urls', 'stored_at', 'expires_at', 'size')
+
+    def __init__(self, data: Dict, stored_at: float, expires_at: float):
+        urls: List[str] = []
+        self.head = self._pack(data, urls, top_level=True)
+        self.formats = tuple(self._pack(f, urls) for f in data.get('formats') or [])
+        self.urls = self._pack_urls(urls)
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        self.size = self._footprint()
+
+    @staticmethod
+    def _pack(fields: Dict, urls: List[str], top_level: bool = False) -> Tuple:
+        values = []
+        for key, value in fields.items():
+            if top_level and key == 'formats':
+                value = None  # packed separately
+            elif not top_level and key == 'url' and isinstance(value, str) and '\n' not in value:
+                urls.append(value)
+                value = _IN_BLOB
+            values.append(_intern(value))
+        return _layout(fields), tuple(values)
+
+    @staticmethod
+    def _pack_urls(urls: List[str]):
+        joined = "\n".join(urls)
+        if config.CACHE_COMPRESS_URLS and urls:
+            compressed = zlib.compress(joined.encode(), 6)
+            if len(compressed) < len(joined):
+                return compressed
+        return joined
+
+    def _unpack_urls(self) -> List[str]:
+        if isinstance(self.urls, bytes):
+            return zlib.decompress(self.urls).decode().split("\n")
+        return self.urls.split("\n")
+
+    @property
+    def data(self) -> Dict:
+        urls = iter(self._unpack_urls())
+        formats = [
+            {key: next(urls) if value is _IN_BLOB else value for key, value in zip(layout, values)}
+            for layout, values in self.formats
+        ]
+        layout, values = self.head
+        return {key: formats if key == 'formats' else value for key, value in zip(layout, values)}
+
+    def _footprint(self) -> int:
+        # Layouts and the blob marker are shared by all entries, so they are not counted here
+        seen = {id(layout) for layout in _layouts.values()}
+        seen.add(id(_IN_BLOB))
+        return (sys.getsizeof(self) + _deep_size(self.head, seen)
+                + _deep_size(self.formats, seen) + _deep_size(self.urls, seen))
+
+    def remaining(self, now: Optional[float] = None) -> float:
+        return self.expires_at - (now if now is not None else time.time())
+
+    def refresh_due(self, now: Optional[float] = None) -> bool:
+        """True once the entry is inside its refresh-ahead window"""
+        lifetime = self.expires_at - self.stored_at
+        window = min(config.CACHE_REFRESH_AHEAD, lifetime * config.CACHE_REFRESH_AHEAD_FRACTION)
+        return self.remaining(now) <= window
+
+
+class VideoCache:
+    """
+    TTL cache of extraction results keyed by canonical URL hash
+    Bounded by the packed size of its entries (max_bytes), not their count
+    """
+
+    def __init__(self, max_bytes: int = config.CACHE_MAX_BYTES):
+        self._entries = TLRUCache(
+            maxsize=max_bytes,
+            ttu=lambda _key, entry, _now: entry.expires_at,
+            timer=time.time,
+            getsizeof=lambda entry: entry.size
+        )
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entry(self, key: str) -> Optional[CacheEntry]:
+        return self._entries.get(key)
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        return entry.data if entry else None
+
+    def set(self, key: str, data: Dict) -> CacheEntry:
+        """Pack and store data; an entry with no lifetime or over the budget is returned unstored"""
+        now = time.time()
+        ttl = entry_ttl(data, now)
+        entry = CacheEntry(data, now, now + ttl)
+        if ttl > 0 and entry.size <= self._entries.maxsize:
+            self._entries[key] = entry
+        return entry
+
+    def replace(self, key: str, old: CacheEntry, data: Dict) -> Optional[CacheEntry]:
+        """
+        Store updated data for an entry, keeping its lifetime; a no-op when
+        the entry was evicted or replaced (a refresh) in the meantime
+        """
+        if self._entries.get(key) is not old:
+            return None
+        entry = CacheEntry(data, old.stored_at, old.expires_at)
+        if entry.size <= self._entries.maxsize:
+            self._entries[key] = entry
+        return entry
+
+    def is_fresh(self, key: str) -> bool:
+        """Cached and not yet due for a refresh"""
+        entry = self._entries.get(key)
+        return entry is not None and not entry.refresh_due()
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Memory actually held by the cache (packed entries, shared layouts excluded)"""
+        entries = list(self._entries.values())
+        return {
+            "entries": len(entries),
+            "bytes": self._entries.currsize,
+            "max_bytes": self._entries.maxsize,
+            "avg_entry_bytes": round(self._entries.currsize / len(entries)) if entries else 0,
+            "compressed_entries": sum(isinstance(e.urls, bytes) for e in entries),
+            "shared_layouts": len(_layouts),
+        }
+
+
+class FailureCache:
+    """
+    Negative cache of deterministic extraction failures
+
+    Stores the error class (private, unavailable, age, unsupported) per
+    canonical URL with a class-specific TTL, so retries of a dead link are
+    answered without running the extractor chain again.
+    """
+
+    def __init__(self, maxsize: int = config.FAILURE_CACHE_SIZE):
+        self._entries = TLRUCache(
+            maxsize=maxsize,
+            ttu=lambda _key, value, now: now + config.FAILURE_TTLS.get(value[0], 0),
+            timer=time.time
+        )
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """(kind, message) of a cached failure"""
+        return self._entries.get(key)
+
+    def set(self, key: str, kind: str, message: str):
+        if kind in config.FAILURE_TTLS:
+            self._entries[key] = (kind, message)
+
+    def discard(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
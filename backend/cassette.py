@@ -0,0 +1,267 @@
+"""
+Cassettes - record and replay upstream traffic
+Record mode captures every upstream HTTP exchange (httpx and requests) and
+every yt-dlp info dict into a versioned JSON file; replay mode serves them
+back with the recorded timing (or scaled by CASSETTE_SPEED), so the full
+request pipeline can be profiled and benchmarked offline, identically on
+every run
+"""
+
+import asyncio
+import atexit
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+import config
+
+CASSETTE_VERSION = 1
+
+# Hop-by-hop and encoding headers that no longer describe a stored (decoded) body
+_DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+
+class CassetteMiss(LookupError):
+    """Replay has no recorded exchange for a request"""
+
+
+class Cassette:
+    """
+    Recorded interactions keyed by kind, method, URL and a body hash
+
+    Replay serves the recordings for a key in their original order; a key
+    asked for more often than it was recorded gets its last recording again.
+    """
+
+    def __init__(self, path: str, mode: str, speed: float = 1.0):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.interactions: List[Dict] = []
+        self._replay: Dict[str, Deque[Dict]] = {}
+        self._last: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._saved = 0
+        if mode == 'replay':
+            self._load()
+
+    @staticmethod
+    def key(kind: str, method: str, url: str, body: Optional[bytes] = None) -> str:
+        digest = hashlib.sha1(body).hexdigest()[:12] if body else "-"
+        return f"{kind} {method} {url} {digest}"
+
+    def _load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(
+                f"Cassette {self.path} is version {data.get('version')}, expected {CASSETTE_VERSION}; record it again"
+            )
+        recorded_with = data.get("ytdlp_version")
+        if recorded_with and recorded_with != _ytdlp_version():
+            if not config.CASSETTE_ALLOW_YTDLP_MISMATCH:
+                raise ValueError(
+                    f"Cassette {self.path} was recorded with yt-dlp {recorded_with}, running {_ytdlp_version()}; "
+                    f"record it again (or set CASSETTE_ALLOW_YTDLP_MISMATCH=1)"
+                )
+            print(f"WARNING: cassette recorded with yt-dlp {recorded_with}, running {_ytdlp_version()}")
+        for item in data.get("interactions", []):
+            self._replay.setdefault(item["key"], deque()).append(item)
+
+    def record(self, key: str, elapsed: float, **fields):
+        with self._lock:
+            self.interactions.append({"key": key, "elapsed": round(elapsed, 4), **fields})
+
+    def play(self, key: str) -> Dict:
+        with self._lock:
+            recordings = self._replay.get(key)
+            if recordings:
+                self._last[key] = recordings.popleft()
+            if key in self._last:
+                return self._last[key]
+        raise CassetteMiss(f"No recording for {key}")
+
+    def delay(self, item: Dict) -> float:
+        """Seconds to wait before answering with item (scaled recorded time)"""
+        return item["elapsed"] / self.speed if self.speed else 0.0
+
+    def save(self):
+        if self.mode != 'record' or len(self.interactions) == self._saved:
+            return
+        with self._lock:
+            self._saved = len(self.interactions)
+            data = {
+                "version": CASSETTE_VERSION,
+                "created": time.time(),
+                "ytdlp_version": _ytdlp_version(),
+                "interactions": list(self.interactions),
+            }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, self.path)
+        print(f"✓ Cassette saved: {len(data['interactions'])} interactions -> {self.path}")
+
+
+def _ytdlp_version() -> Optional[str]:
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return version("yt-dlp")
+    except PackageNotFoundError:
+        return None
+
+
+def _encode(body: bytes) -> str:
+    return base64.b64encode(body).decode()
+
+
+def _stored_headers(items) -> List[List[str]]:
+    return [[name, value] for name, value in items if name.lower() not in _DROPPED_HEADERS]
+
+
+_active: Optional[Cassette] = None
+
+
+def active() -> Optional[Cassette]:
+    return _active
+
+
+def activate(mode: str = config.CASSETTE_MODE, path: str = config.CASSETTE_PATH,
+             speed: float = config.CASSETTE_SPEED) -> Optional[Cassette]:
+    """Start recording or replaying (no-op when mode is neither)"""
+    global _active
+    if mode not in ('record', 'replay') or _active is not None:
+        return _active
+    _active = Cassette(path, mode, speed)
+    _patch_requests()
+    atexit.register(_active.save)
+    print(f"🎞 Cassette {mode}: {path}" + (f" (speed x{speed})" if mode == 'replay' else ""))
+    return _active
+
+
+def save():
+    if _active is not None:
+        _active.save()
+
+
+def httpx_transport(limits=None):
+    """Transport for the pooled httpx client, None when no cassette is active"""
+    if _active is None:
+        return None
+    import httpx
+
+    cassette = _active
+
+    class CassetteTransport(httpx.AsyncBaseTransport):
+        def __init__(self):
+            self.inner = httpx.AsyncHTTPTransport(limits=limits) if limits else httpx.AsyncHTTPTransport()
+
+        async def handle_async_request(self, request):
+            body = await request.aread()
+            key = Cassette.key("http", request.method, str(request.url), body)
+
+            if cassette.mode == 'replay':
+                item = cassette.play(key)
+                await asyncio.sleep(cassette.delay(item))
+                return httpx.Response(item["status"], headers=item["headers"], content=base64.b64decode(item["body"]))
+
+            started = time.monotonic()
+            response = await self.inner.handle_async_request(request)
+            try:
+                # Decoded body, so the stored headers drop Content-Encoding
+                content = await httpx.Response(
+                    response.status_code, headers=response.headers, stream=response.stream
+                ).aread()
+            finally:
+                await response.aclose()
+            headers = _stored_headers(response.headers.multi_items())
+            cassette.record(key, time.monotonic() - started, status=response.status_code,
+                            headers=headers, body=_encode(content))
+            return httpx.Response(response.status_code, headers=headers, content=content)
+
+        async def aclose(self):
+            await self.inner.aclose()
+
+    return CassetteTransport()
+
+
+def _patch_requests():
+    """Route every requests.Session through the cassette (DoH lookups included)"""
+    try:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+    except ImportError:
+        return
+
+    original_send = HTTPAdapter.send
+
+    def send(adapter, request, **kwargs):
+        cassette = _active
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        key = Cassette.key("http", request.method, request.url, body)
+
+        if cassette.mode == 'replay':
+            item = cassette.play(key)
+            time.sleep(cassette.delay(item))
+            response = requests.Response()
+            response.status_code = item["status"]
+            response.headers = CaseInsensitiveDict(dict(item["headers"]))
+            response._content = base64.b64decode(item["body"])
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.url = request.url
+            response.request = request
+            response.connection = adapter
+            return response
+
+        started = time.monotonic()
+        response = original_send(adapter, request, **kwargs)
+        content = response.content
+        cassette.record(key, time.monotonic() - started, status=response.status_code,
+                        headers=_stored_headers(response.headers.items()), body=_encode(content))
+        return response
+
+    HTTPAdapter.send = send
+
+
+def ytdlp_info(url: str, extract: Callable[[], Optional[Dict]], variant: str = "info", logger=None) -> Optional[Dict]:
+    """
+    Run a blocking yt-dlp extraction through the cassette
+
+    Records the JSON-safe info dict (and the logger's last error, used to
+    classify failures) or replays it, sleeping the scaled recorded time.
+    """
+    cassette = _active
+    if cassette is None:
+        return extract()
+    key = Cassette.key("ytdlp", variant, url)
+
+    if cassette.mode == 'replay':
+        item = cassette.play(key)
+        time.sleep(cassette.delay(item))
+        if logger is not None and item.get("last_error"):
+            logger.last_error = item["last_error"]
+        if item.get("error"):
+            raise RuntimeError(item["error"])
+        return item["info"]
+
+    started = time.monotonic()
+    try:
+        info = extract()
+    except Exception as e:
+        cassette.record(key, time.monotonic() - started, info=None, error=str(e))
+        raise
+    cassette.record(
+        key, time.monotonic() - started,
+        info=json.loads(json.dumps(info, default=str)) if info is not None else None,
+        last_error=getattr(logger, 'last_error', None)
+    )
+    return info
@@ -3,6 +3,8 @@ Configuration for Video Downloader Backend
 Optimized for free hosting platforms (Hugging Face Spaces, Render, Railway)
 """
 
+import os
+
 # Cobalt API - FREE, no API key needed
 COBALT_API_URL = "https://api.cobalt.tools/api/json"
 
@@ -13,13 +15,138 @@ COBALT_FALLBACK_URLS = [
 ]
 
 # Cache settings
-CACHE_TTL = 300  # 5 minutes
-MAX_CACHE_SIZE = 100
+CACHE_TTL = 300  # 5 minutes, for results whose URLs carry no expiry
+CACHE_MAX_BYTES = 16 * 1024 * 1024  # packed size of all cached results
+CACHE_COMPRESS_URLS = True  # zlib the format URLs of an entry when that saves space
+CACHE_INTERN_MAX_LENGTH = 32  # strings up to this length are interned (labels, sizes, ...)
+CACHE_EXPIRY_MARGIN = 300  # stop serving signed URLs this long before they expire
+CACHE_MIN_TTL = 30  # results whose links expire sooner than this are not cached
+CACHE_MAX_TTL = 6 * 3600
+CACHE_REFRESH_AHEAD = 600  # refresh hot entries within this many seconds of expiry...
+CACHE_REFRESH_AHEAD_FRACTION = 0.2  # ...or within this fraction of their lifetime, if shorter
+CACHE_REFRESH_MIN_SCORE = 3  # popularity needed for an entry to count as hot
+
+# Negative cache for deterministic failures (seconds per error class)
+# Transient errors (timeouts, rate limits, network) are never cached
+FAILURE_TTLS = {
+    'private': 600,  # owners flip videos back to public
+    'age': 3600,
+    'unavailable': 1800,
+    'unsupported': 24 * 3600,
+}
+FAILURE_CACHE_SIZE = 1000
+
+# Cache warm-up (popular URLs are pre-extracted after a restart)
+WARMUP_ENABLED = True
+WARMUP_TOP_K = 20
+WARMUP_STATE_FILE = "warmup_state.json"
+WARMUP_INTERVAL = 600  # seconds between warm-up passes
+WARMUP_STARTUP_DELAY = 5  # let the server settle before the first pass
+WARMUP_CONCURRENCY = 1  # warm-up extractions running at once
+WARMUP_IDLE_POLL = 1  # seconds to wait while live extractions are running
+WARMUP_DECAY = 0.5  # popularity kept per interval
+WARMUP_SKETCH_WIDTH = 2048
+WARMUP_SKETCH_DEPTH = 4
 
 # Request settings
 TIMEOUT = 30
 MAX_RETRIES = 3
-RETRY_DELAY = 1  # seconds
+RETRY_DELAY = 1  # seconds, doubled per retry (with full jitter)
+RETRY_MAX_DELAY = 4  # cap for a single backoff
+
+# End-to-end budget for one extraction (every extractor, HTTP call and retry)
+REQUEST_DEADLINE = 20  # seconds
+PRIMARY_BUDGET_SHARE = 0.6  # part of the budget the primary may use before the fallback runs
+
+# Profiling (opt-in). Admin endpoints and X-Profile need ADMIN_TOKEN
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))  # fraction of requests profiled anyway
+PROFILE_MAX_SECONDS = 300  # admin sessions stop on their own after this
+PROFILE_DIR = "profiles"
+PROFILE_KEEP = 50  # newest profiles kept on disk
+LOOP_LAG_THRESHOLD_MS = int(os.environ.get("LOOP_LAG_THRESHOLD_MS", 0))  # 0 = lag monitor off
+
+# Speculative fallback (hedging): start the fallback alongside a primary that
+# is slower than its usual p90, first result with formats wins
+HEDGE_ENABLED = True
+HEDGE_PLATFORMS = ['tiktok', 'instagram', 'facebook', 'twitter', 'reddit', 'unknown']  # both extractors cover these
+HEDGE_PERCENTILE = 0.9
+HEDGE_SAMPLES = 200  # recent latencies kept per platform and extractor
+HEDGE_MIN_SAMPLES = 20  # below this the default delay is used
+HEDGE_DEFAULT_DELAY = 4  # seconds
+HEDGE_MIN_DELAY = 1
+HEDGE_MAX_DELAY = 8
+HEDGE_MAX_RATIO = 0.2  # speculative runs allowed per extraction (long-run average)
+HEDGE_BURST = 5  # speculative runs allowed back to back
+
+# Shared HTTP connection pool
+HTTP_MAX_CONNECTIONS = 50
+HTTP_MAX_KEEPALIVE = 20
+HTTP_KEEPALIVE_EXPIRY = 60  # seconds an idle connection is kept open
+
+# Connection pre-warming of the known upstreams (Cobalt API hosts)
+PREWARM_ENABLED = os.environ.get("PREWARM_ENABLED", "1") != "0"
+PREWARM_MIN_IDLE = 2  # pooled connections kept open per host
+PREWARM_INTERVAL = 45  # seconds between keep-alive rounds (below HTTP_KEEPALIVE_EXPIRY)
+PREWARM_IDLE_STOP = 600  # keep-alive rounds pause after this long without upstream requests
+PREWARM_TIMEOUT = 5
+
+# Size probing: HEAD / one-byte Range requests fill in missing or estimated file sizes
+# of a new cache entry, in the background after the first response
+SIZE_PROBE_ENABLED = True
+SIZE_PROBE_BUDGET = 1.5  # seconds for all probes of one extraction
+SIZE_PROBE_MAX_FORMATS = 12
+
+# ZIP download of multi-item posts (/api/zip); memory held is about
+# ZIP_FETCH_CONCURRENCY * ZIP_QUEUE_CHUNKS * ZIP_CHUNK_SIZE
+ZIP_FETCH_CONCURRENCY = 4  # items downloading at once (the one being written included)
+ZIP_QUEUE_CHUNKS = 16  # chunks an item may read ahead of the writer
+ZIP_CHUNK_SIZE = 64 * 1024
+ZIP_MAX_ITEMS = 50
+
+# Record/replay of upstream traffic for offline benchmarks (off, record, replay)
+CASSETTE_MODE = os.environ.get("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.environ.get("CASSETTE_PATH", "cassettes/default.json")
+CASSETTE_SPEED = float(os.environ.get("CASSETTE_SPEED", 1))  # replay timing: 1 = as recorded, 0 = no delays
+CASSETTE_ALLOW_YTDLP_MISMATCH = os.environ.get("CASSETTE_ALLOW_YTDLP_MISMATCH") == "1"  # replay across yt-dlp versions anyway
+
+# Metadata preview (phase one of extraction: title, thumbnail, duration)
+PREVIEW_TIMEOUT = 5  # per network call
+PREVIEW_DEADLINE = 10  # whole preview: oEmbed, then yt-dlp
+PREVIEW_CACHE_TTL = 3600  # metadata does not expire like signed media URLs
+PREVIEW_CACHE_SIZE = 500
+
+# Playlists and channels (flat listing, paginated)
+PLAYLIST_PAGE_SIZE = 50
+PLAYLIST_MAX_PAGE_SIZE = 200
+PLAYLIST_FETCH_BATCH = 10  # entries pulled from yt-dlp per step while streaming
+PLAYLIST_CACHE_TTL = 1800
+PLAYLIST_CACHE_SIZE = 50
+
+# Thumbnail proxy (/api/thumb)
+THUMB_WIDTHS = (160, 320, 480, 640, 1280)  # requested widths snap up to these
+THUMB_DEFAULT_WIDTH = 480
+THUMB_JPEG_QUALITY = 80
+THUMB_FETCH_TIMEOUT = 10
+THUMB_MAX_SOURCE_BYTES = 8 * 1024 * 1024
+THUMB_MEMORY_BYTES = 32 * 1024 * 1024
+THUMB_CACHE_DIR = "thumb_cache"
+THUMB_DISK_MAX_BYTES = 256 * 1024 * 1024
+THUMB_DISK_PRUNE_EVERY = 50  # writes between disk budget checks
+THUMB_MAX_AGE = 7 * 24 * 3600  # browser/CDN cache lifetime for resized images
+# Key for signed /api/thumb URLs. Without the env var, one is generated once
+# and kept in THUMB_SIGNING_KEY_FILE so URLs survive restarts and work on every worker
+THUMB_SIGNING_KEY = os.environ.get("THUMB_SIGNING_KEY")
+THUMB_SIGNING_KEY_FILE = "thumb_signing.key"
+
+# oEmbed endpoints per platform (no API key needed)
+OEMBED_ENDPOINTS = {
+    'youtube': "https://www.youtube.com/oembed",
+    'tiktok': "https://www.tiktok.com/oembed",
+    'reddit': "https://www.reddit.com/oembed",
+    'twitter': "https://publish.twitter.com/oembed",
+}
 
 # User agents for rotation (mimic real browsers)
 USER_AGENTS = [
@@ -55,4 +182,6 @@ YT_DLP_OPTIONS = {
     'extractor_retries': 3,
     'fragment_retries': 3,
     'skip_unavailable_fragments': True,
+    'noplaylist': True,  # watch?v=...&list=... extracts just the video
+    'extract_flat': 'in_playlist',  # never resolve every entry of a playlist URL
 }
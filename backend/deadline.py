@@ -0,0 +1,91 @@
+"""
+Deadline - one time budget for a whole extraction
+Extractors, HTTP calls and retry loops take their timeouts from what is
+left of the budget instead of each using its own fixed limit
+"""
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Optional
+import config
+
+
+class DeadlineExceeded(Exception):
+    """The budget ran out; stage names the step that was running at the time"""
+    
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"Timed out during {stage} ({budget:.0f}s budget)")
+        self.stage = stage
+        self.budget = budget
+
+
+def backoff_delay(n: int) -> float:
+    """
+    Exponential backoff with full jitter for retry number n (0-based)
+    Named n because yt-dlp calls its retry_sleep_functions as sleep_func(n=...)
+    """
+    ceiling = min(config.RETRY_MAX_DELAY, config.RETRY_DELAY * 2 ** n)
+    return random.uniform(0, ceiling)
+
+
+class Deadline:
+    """Absolute expiry on the monotonic clock plus the stage currently running"""
+    
+    __slots__ = ('budget', 'expires_at', 'stage')
+    
+    def __init__(self, budget: float = config.REQUEST_DEADLINE):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self.stage = 'start'
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+    
+    def check(self, stage: Optional[str] = None):
+        """Enter stage (if given); raise DeadlineExceeded if no time is left"""
+        if stage:
+            self.stage = stage
+        if self.expired:
+            raise DeadlineExceeded(self.stage, self.budget)
+    
+    def timeout(self, cap: float) -> float:
+        """Per-call timeout: cap, or less if the budget ends sooner"""
+        self.check()
+        return min(cap, self.remaining())
+    
+    def cancel(self):
+        """Expire now; whatever runs under this deadline stops at its next check"""
+        self.expires_at = time.monotonic()
+    
+    def share(self, fraction: float) -> 'Deadline':
+        """Sub-budget covering fraction of the time left (never outlives this one)"""
+        return Deadline(self.remaining() * fraction)
+    
+    async def run(self, stage: str, awaitable: Awaitable):
+        """Await awaitable within the time left, as stage"""
+        try:
+            self.check(stage)
+        except DeadlineExceeded:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage, self.budget)
+    
+    async def backoff(self, attempt: int) -> bool:
+        """
+        Sleep before retry attempt
+        Returns False without sleeping when the retry could not finish in time
+        """
+        delay = backoff_delay(attempt)
+        if delay >= self.remaining():
+            return False
+        await asyncio.sleep(delay)
+        return True
@@ -3,19 +3,82 @@ Video Extractors - Multi-strategy extraction system
 Uses FREE services: Cobalt API (no API key) + yt-dlp fallback
 """
 
-import httpx
-import yt_dlp
+import asyncio
 import random
-from typing import Dict, Optional, List
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, List, Tuple
 from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+import cassette
 import config
+from deadline import Deadline, DeadlineExceeded, backoff_delay
+from http_client import get_client
+from sizes import format_size
+
+# Error classes worth caching: the same URL will fail the same way on retry
+FAILURE_PATTERNS = {
+    'private': ['private video', 'video is private', 'content.video.private', 'this account is private'],
+    'age': ['confirm your age', 'age-restricted', 'age restricted', 'content.video.age', 'inappropriate for some users'],
+    'unavailable': [
+        'video unavailable', 'no longer available', 'has been removed', 'been deleted',
+        'content.video.unavailable', 'does not exist', 'account has been terminated', 'content.post.unavailable'
+    ],
+    'unsupported': ['unsupported url', 'link.unsupported', 'service.unsupported', 'link.invalid', 'looks truncated'],
+}
+
+# Errors that may go away on retry; never cached
+TRANSIENT_PATTERNS = [
+    'timed out', 'timeout', 'connection', 'temporarily', 'try again', 'rate limit', 'rate-limit',
+    'too many requests', '429', '500', '502', '503', '504', 'failed to resolve', 'name or service',
+    'network', 'ssl', 'fetch.fail', 'api.capacity',
+]
+
+# yt-dlp's retry backoff (it calls these as sleep_func(n=retry number))
+RETRY_SLEEP_FUNCTIONS = {'extractor': backoff_delay, 'http': backoff_delay}
+
+
+class ExtractionError(Exception):
+    """
+    Extraction failure with an optional error class
+    kind is one of FAILURE_PATTERNS' keys when the failure is deterministic,
+    None when it may be transient
+    """
+    
+    def __init__(self, message: str, kind: Optional[str] = None):
+        super().__init__(message)
+        self.kind = kind
+
+
+def detect_platform(url: str) -> str:
+    """Platform of a URL (a PLATFORM_PATTERNS key), 'unknown' if none matches"""
+    url_lower = url.lower()
+    for platform, patterns in config.PLATFORM_PATTERNS.items():
+        if any(pattern in url_lower for pattern in patterns):
+            return platform
+    return 'unknown'
+
+
+def classify_error(message: str) -> Optional[str]:
+    """Deterministic error class for an extractor message, None if transient or unknown"""
+    text = (message or '').lower()
+    if any(pattern in text for pattern in TRANSIENT_PATTERNS):
+        return None
+    for kind, patterns in FAILURE_PATTERNS.items():
+        if any(pattern in text for pattern in patterns):
+            return kind
+    return None
+
 
 class BaseExtractor(ABC):
     """Base class for all extractors"""
     
     @abstractmethod
-    async def extract(self, url: str) -> Optional[Dict]:
-        """Extract video info from URL"""
+    async def extract(self, url: str, deadline: Optional[Deadline] = None) -> Optional[Dict]:
+        """
+        Extract video info from URL (raises ExtractionError with the upstream reason)
+        Every network call has to finish within deadline (DeadlineExceeded otherwise)
+        """
         pass
     
     def get_random_user_agent(self) -> str:
@@ -32,9 +95,10 @@ class CobaltExtractor(BaseExtractor):
     def __init__(self):
         self.api_urls = [config.COBALT_API_URL] + config.COBALT_FALLBACK_URLS
     
-    async def extract(self, url: str) -> Optional[Dict]:
+    async def extract(self, url: str, deadline: Optional[Deadline] = None) -> Optional[Dict]:
         """Extract using Cobalt API"""
         
+        deadline = deadline or Deadline()
         payload = {
             "url": url,
             "vCodec": "h264",
@@ -51,26 +115,71 @@ class CobaltExtractor(BaseExtractor):
             "User-Agent": self.get_random_user_agent()
         }
         
-        # Try each Cobalt instance
-        for api_url in self.api_urls:
-            try:
-                async with httpx.AsyncClient(timeout=config.TIMEOUT) as client:
-                    response = await client.post(api_url, json=payload, headers=headers)
+        client = get_client()
+        last_error = None
+        
+        # Try each Cobalt instance; retry the round with backoff while the
+        # failures look transient and the budget allows it
+        for attempt in range(config.MAX_RETRIES + 1):
+            for api_url in self.api_urls:
+                stage = f"Cobalt ({urlparse(api_url).netloc})"
+                try:
+                    deadline.check(stage)
+                    response = await deadline.run(stage, client.post(
+                        api_url,
+                        json=payload,
+                        headers=headers,
+                        timeout=deadline.timeout(config.TIMEOUT)
+                    ))
                     
                     if response.status_code == 200:
                         data = response.json()
-                        return self._parse_cobalt_response(data, url)
+                        result = self._parse_cobalt_response(data, url)
+                        if result:
+                            return result
                     
-            except Exception as e:
-                print(f"Cobalt API ({api_url}) failed: {str(e)}")
-                continue
+                    last_error = f"Cobalt: {self._error_text(response)}"
+                    
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    deadline.check()
+                    print(f"Cobalt API ({api_url}) failed: {str(e)}")
+                    last_error = f"Cobalt connection error: {str(e)}"
+                    continue
+                
+                # A private or deleted video is the same on every instance
+                if classify_error(last_error) in ('private', 'age', 'unavailable'):
+                    raise ExtractionError(last_error)
+            
+            if last_error is None or classify_error(last_error):
+                break
+            if attempt < config.MAX_RETRIES:
+                if not await deadline.backoff(attempt):
+                    print("Cobalt: no budget left for another retry")
+                    break
+                print(f"Cobalt: retry {attempt + 1}/{config.MAX_RETRIES}")
         
+        if last_error:
+            raise ExtractionError(last_error)
         return None
     
+    @staticmethod
+    def _error_text(response) -> str:
+        """Error text/code from a Cobalt error response"""
+        try:
+            data = response.json()
+        except Exception:
+            return f"HTTP {response.status_code}"
+        error = data.get("error")
+        if isinstance(error, dict) and error.get("code"):
+            return error["code"]
+        return data.get("text") or f"HTTP {response.status_code}"
+    
     def _parse_cobalt_response(self, data: Dict, original_url: str) -> Optional[Dict]:
         """Parse Cobalt API response to standard format"""
         
-        if data.get("status") != "success" and data.get("status") != "stream":
+        if data.get("status") not in ("success", "stream", "picker"):
             return None
         
         formats = []
@@ -97,25 +206,71 @@ class CobaltExtractor(BaseExtractor):
                 "ext": "mp3"
             })
         
-        # Picker (multiple quality options)
+        # Picker (multiple quality options, or the items of a carousel /
+        # multi-media post); kept as a list too for /api/zip
         picker = data.get("picker")
+        items = []
         if picker and isinstance(picker, list):
             for idx, item in enumerate(picker):
+                if not item.get("url"):
+                    continue
+                kind = item.get("type") or "video"
+                ext = "jpg" if kind == "photo" else "mp4"
                 formats.append({
                     "label": f"Quality {idx + 1}",
                     "quality": "hd" if idx == 0 else "sd",
                     "file_size": None,
-                    "url": item.get("url"),
-                    "ext": "mp4"
+                    "url": item["url"],
+                    "ext": ext
                 })
+                items.append({"type": kind, "url": item["url"], "ext": ext})
         
-        return {
+        result = {
             "title": data.get("filename", "Video"),
             "thumbnail": None,
             "platform": "Cobalt",
             "duration": None,
             "formats": formats
         }
+        if len(items) > 1:
+            result["picker"] = items
+        return result
+
+
+class YtDlpLogger:
+    """
+    yt-dlp logger that keeps the last error message for classification
+    It also stops the worker thread once the deadline has passed: yt-dlp
+    logs every step, and DownloadCancelled raised here aborts extract_info.
+    """
+    
+    def __init__(self, deadline: Optional[Deadline] = None):
+        self.last_error: Optional[str] = None
+        self.deadline = deadline
+    
+    def _check_deadline(self):
+        if self.deadline and self.deadline.expired:
+            from yt_dlp.utils import DownloadCancelled
+            raise DownloadCancelled(f"deadline passed during {self.deadline.stage}")
+    
+    def debug(self, msg):
+        print(msg)
+        self._check_deadline()
+    
+    def info(self, msg):
+        print(msg)
+        self._check_deadline()
+    
+    def warning(self, msg):
+        print(msg)
+        self._check_deadline()
+    
+    def error(self, msg):
+        print(msg)
+        # With verbose on, yt-dlp follows each error message with its traceback
+        if msg.startswith(("Traceback", "  File ")):
+            return
+        self.last_error = msg
 
 
 class YtDlpExtractor(BaseExtractor):
@@ -124,24 +279,50 @@ class YtDlpExtractor(BaseExtractor):
     Best for: YouTube, Facebook
     """
     
-    async def extract(self, url: str) -> Optional[Dict]:
+    async def extract(self, url: str, deadline: Optional[Deadline] = None) -> Optional[Dict]:
         """Extract using yt-dlp"""
         
+        deadline = deadline or Deadline()
+        deadline.check("yt-dlp")
         ydl_opts = config.YT_DLP_OPTIONS.copy()
         ydl_opts['user_agent'] = self.get_random_user_agent()
+        # No single socket wait may outlive the budget; yt-dlp's own retries back off with jitter
+        ydl_opts['socket_timeout'] = max(1, deadline.timeout(ydl_opts['socket_timeout']))
+        ydl_opts['retry_sleep_functions'] = RETRY_SLEEP_FUNCTIONS
+        logger = YtDlpLogger(deadline)
+        ydl_opts['logger'] = logger
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                if not info:
-                    return None
-                
-                return self._parse_ytdlp_response(info)
-                
+            # yt-dlp is blocking; keep it off the event loop
+            info = await deadline.run("yt-dlp", asyncio.to_thread(self._extract_info, url, ydl_opts))
+        except DeadlineExceeded:
+            raise
         except Exception as e:
+            deadline.check()
             print(f"yt-dlp extraction failed: {str(e)}")
+            raise ExtractionError(f"yt-dlp: {str(e)}")
+        
+        if not info:
+            # ignoreerrors makes yt-dlp return None; the reason went to the logger
+            if logger.last_error:
+                raise ExtractionError(f"yt-dlp: {logger.last_error}")
             return None
+        
+        if info.get('_type') in ('playlist', 'multi_video'):
+            print("yt-dlp returned a playlist; use /api/playlist for its entries")
+            return None
+        
+        return self._parse_ytdlp_response(info)
+    
+    def _extract_info(self, url: str, ydl_opts: Dict) -> Optional[Dict]:
+        # yt-dlp pulls in hundreds of extractor modules; load it on first use
+        import yt_dlp
+        
+        def extract():
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                return ydl.extract_info(url, download=False)
+        
+        return cassette.ytdlp_info(url, extract, logger=ydl_opts.get('logger'))
     
     def _parse_ytdlp_response(self, info: Dict) -> Dict:
         """Parse yt-dlp response to standard format"""
@@ -152,15 +333,6 @@ class YtDlpExtractor(BaseExtractor):
         duration_s = info.get('duration') or 0
         
         # Helper functions
-        def format_size(bytes_val):
-            if not bytes_val:
-                return None
-            for unit in ['B', 'KB', 'MB', 'GB']:
-                if bytes_val < 1024.0:
-                    return f"{bytes_val:.1f} {unit}"
-                bytes_val /= 1024.0
-            return f"{bytes_val:.1f} TB"
-        
         def get_size(f_info, duration_s):
             size = f_info.get('filesize') or f_info.get('filesize_approx')
             if size:
@@ -185,6 +357,7 @@ class YtDlpExtractor(BaseExtractor):
                 "label": "Audio (Best)",
                 "quality": "audio",
                 "file_size": format_size(audio_size),
+                "size_estimated": not best_audio.get('filesize'),
                 "url": best_audio.get('url'),
                 "ext": "mp3"
             })
@@ -237,6 +410,9 @@ class YtDlpExtractor(BaseExtractor):
                 "label": label,
                 "quality": quality_type,
                 "file_size": format_size(total_size),
+                # Only muxed formats: a video-only URL is not what the size above counts
+                "size_estimated": not f.get('filesize') and f.get('acodec') != 'none',
+                "video_only": f.get('acodec') == 'none',
                 "url": f.get('url'),
                 "ext": "mp4"
             })
@@ -251,6 +427,174 @@ class YtDlpExtractor(BaseExtractor):
         }
 
 
+def format_duration(seconds) -> Optional[str]:
+    """Seconds to "H:MM:SS" / "M:SS" (same shape as yt-dlp's duration_string)"""
+    if not seconds:
+        return None
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+class PreviewExtractor(BaseExtractor):
+    """
+    Metadata-only extractor (phase one)
+    Returns title, thumbnail and duration without resolving any formats:
+    oEmbed where the platform offers it, unprocessed yt-dlp info otherwise
+    """
+    
+    async def extract(self, url: str, deadline: Optional[Deadline] = None) -> Optional[Dict]:
+        """
+        Extract preview metadata
+        None when no preview could be loaded; ExtractionError when the
+        failure is deterministic (private, unavailable, ...)
+        """
+        
+        deadline = deadline or Deadline(config.PREVIEW_DEADLINE)
+        endpoint = config.OEMBED_ENDPOINTS.get(detect_platform(url))
+        if endpoint:
+            result = await self._extract_oembed(endpoint, url, deadline)
+            if result:
+                return result
+        
+        logger = YtDlpLogger(deadline)
+        try:
+            info = await deadline.run(
+                "yt-dlp preview",
+                asyncio.to_thread(self._extract_info, url, deadline.timeout(config.PREVIEW_TIMEOUT), logger)
+            )
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            deadline.check()
+            print(f"Preview extraction failed: {str(e)}")
+            kind = classify_error(str(e))
+            if kind:
+                raise ExtractionError(f"yt-dlp: {str(e)}", kind=kind)
+            return None
+        
+        if not info:
+            return None
+        
+        return {
+            "title": info.get('title'),
+            "thumbnail": info.get('thumbnail') or self._first_thumbnail(info.get('thumbnails')),
+            "platform": info.get('extractor_key') or info.get('ie_key'),
+            "duration": format_duration(info.get('duration')),
+            "formats": [],
+            "formats_pending": True
+        }
+    
+    async def _extract_oembed(self, endpoint: str, url: str, deadline: Deadline) -> Optional[Dict]:
+        try:
+            response = await deadline.run("oEmbed", get_client().get(
+                endpoint,
+                params={"url": url, "format": "json"},
+                headers={"User-Agent": self.get_random_user_agent()},
+                timeout=deadline.timeout(config.PREVIEW_TIMEOUT)
+            ))
+            if response.status_code != 200:
+                return None
+            data = response.json()
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"oEmbed ({endpoint}) failed: {str(e)}")
+            return None
+        
+        if not data.get('title'):
+            return None
+        
+        return {
+            "title": data.get('title'),
+            "thumbnail": data.get('thumbnail_url'),
+            "platform": data.get('provider_name'),
+            "duration": None,
+            "formats": [],
+            "formats_pending": True
+        }
+    
+    def _extract_info(self, url: str, socket_timeout: float, logger: YtDlpLogger) -> Optional[Dict]:
+        import yt_dlp
+        
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'skip_download': True,
+            'extract_flat': True,
+            'noplaylist': True,
+            'socket_timeout': max(1, socket_timeout),
+            'user_agent': self.get_random_user_agent(),
+            # Stops the worker thread once the deadline passed (see YtDlpLogger)
+            'logger': logger,
+        }
+        def extract():
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                # process=False stops before format selection and URL resolution
+                return ydl.extract_info(url, download=False, process=False)
+        
+        return cassette.ytdlp_info(url, extract, logger=logger, variant="preview")
+    
+    @staticmethod
+    def _first_thumbnail(thumbnails) -> Optional[str]:
+        if not thumbnails:
+            return None
+        return thumbnails[-1].get('url')
+
+
+class LatencyTracker:
+    """Recent successful extraction times per (platform, extractor)"""
+    
+    def __init__(self, samples: int = config.HEDGE_SAMPLES):
+        self.samples = samples
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+    
+    def record(self, platform: str, name: str, seconds: float):
+        key = (platform, name)
+        if key not in self._latencies:
+            self._latencies[key] = deque(maxlen=self.samples)
+        self._latencies[key].append(seconds)
+    
+    def percentile(self, platform: str, name: str, q: float = config.HEDGE_PERCENTILE) -> Optional[float]:
+        latencies = self._latencies.get((platform, name))
+        if not latencies or len(latencies) < config.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+    def hedge_delay(self, platform: str, name: str) -> float:
+        """How long to wait for name before starting the fallback"""
+        p90 = self.percentile(platform, name)
+        if p90 is None:
+            return config.HEDGE_DEFAULT_DELAY
+        return max(config.HEDGE_MIN_DELAY, min(p90, config.HEDGE_MAX_DELAY))
+
+
+class HedgeBudget:
+    """
+    Token bucket bounding speculative runs
+    Every extraction adds HEDGE_MAX_RATIO tokens (up to HEDGE_BURST), every
+    hedge costs one, so on average at most that fraction get a second run
+    """
+    
+    def __init__(self, ratio: float = config.HEDGE_MAX_RATIO, burst: float = config.HEDGE_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+    
+    def observe(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+    
+    def take(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
 class VideoExtractorManager:
     """
     Manages extraction strategies with automatic fallback
@@ -258,18 +602,41 @@ class VideoExtractorManager:
     """
     
     def __init__(self):
-        self.cobalt = CobaltExtractor()
-        self.ytdlp = YtDlpExtractor()
+        self._cobalt: Optional[CobaltExtractor] = None
+        self._ytdlp: Optional[YtDlpExtractor] = None
+        self._preview: Optional[PreviewExtractor] = None
+        self.latency = LatencyTracker()
+        self.hedge_budget = HedgeBudget()
+        self.hedge_stats = {"hedged": 0, "hedge_wins": 0, "hedge_denied": 0}
+    
+    @property
+    def cobalt(self) -> CobaltExtractor:
+        if self._cobalt is None:
+            self._cobalt = CobaltExtractor()
+        return self._cobalt
+    
+    @property
+    def ytdlp(self) -> YtDlpExtractor:
+        if self._ytdlp is None:
+            self._ytdlp = YtDlpExtractor()
+        return self._ytdlp
+    
+    @property
+    def preview(self) -> PreviewExtractor:
+        if self._preview is None:
+            self._preview = PreviewExtractor()
+        return self._preview
     
     def detect_platform(self, url: str) -> str:
         """Detect platform from URL"""
-        url_lower = url.lower()
-        for platform, patterns in config.PLATFORM_PATTERNS.items():
-            if any(pattern in url_lower for pattern in patterns):
-                return platform
-        return 'unknown'
+        return detect_platform(url)
+    
+    @staticmethod
+    def cobalt_first(platform: str) -> bool:
+        """Whether Cobalt is the primary extractor for a platform (yt-dlp otherwise)"""
+        return platform in ['tiktok', 'instagram', 'twitter', 'reddit']
     
-    async def extract(self, url: str) -> Dict:
+    async def extract(self, url: str, deadline: Optional[Deadline] = None) -> Dict:
         """
         Extract video info with automatic fallback
         
@@ -277,13 +644,21 @@ class VideoExtractorManager:
         1. For TikTok/Instagram/Twitter/Reddit: Try Cobalt first
         2. For YouTube/Facebook: Try yt-dlp first
         3. Always fallback to the other method if primary fails
+        
+        The whole chain shares one deadline (REQUEST_DEADLINE by default). The
+        primary may use PRIMARY_BUDGET_SHARE of it so the fallback still gets a
+        turn; DeadlineExceeded is raised once the overall budget is gone.
+        
+        On HEDGE_PLATFORMS a primary that is slower than its usual p90 gets
+        the fallback started alongside it (see _race).
         """
         
+        deadline = deadline or Deadline()
         platform = self.detect_platform(url)
         print(f"Detected platform: {platform}")
         
         # Determine primary strategy
-        if platform in ['tiktok', 'instagram', 'twitter', 'reddit']:
+        if self.cobalt_first(platform):
             primary = self.cobalt
             fallback = self.ytdlp
             primary_name = "Cobalt"
@@ -294,21 +669,118 @@ class VideoExtractorManager:
             primary_name = "yt-dlp"
             fallback_name = "Cobalt"
         
-        # Try primary strategy
-        print(f"Trying {primary_name}...")
-        result = await primary.extract(url)
+        errors: List[Exception] = []
         
-        if result and result.get('formats'):
-            print(f"✓ {primary_name} succeeded")
+        result = await self._race(platform, url, (primary_name, primary), (fallback_name, fallback), errors, deadline)
+        if result:
             return result
         
-        # Fallback strategy
-        print(f"✗ {primary_name} failed, trying {fallback_name}...")
-        result = await fallback.extract(url)
+        # Out of time: report the stage that was running, not a generic failure
+        timeouts = [e for e in errors if isinstance(e, DeadlineExceeded)]
+        if deadline.expired and timeouts:
+            raise timeouts[-1]
         
+        # Both failed
+        raise ExtractionError(
+            f"All extraction methods failed for {platform}: " + "; ".join(str(e) for e in errors),
+            kind=self._failure_kind(errors)
+        )
+    
+    async def _race(self, platform: str, url: str, primary: Tuple[str, BaseExtractor],
+                    fallback: Tuple[str, BaseExtractor], errors: List[Exception],
+                    deadline: Deadline) -> Optional[Dict]:
+        """
+        Primary, then fallback; returns the first result with formats
+        
+        When hedging applies and the primary has not answered within its
+        hedge delay, the fallback starts in parallel (if HedgeBudget allows).
+        The run that loses is cancelled; its deadline is expired too, so a
+        yt-dlp worker thread stops at its next log line.
+        """
+        primary_name, fallback_name = primary[0], fallback[0]
+        hedge_delay = None
+        if config.HEDGE_ENABLED and platform in config.HEDGE_PLATFORMS:
+            self.hedge_budget.observe()
+            hedge_delay = self.latency.hedge_delay(platform, primary_name)
+        
+        runs: Dict[asyncio.Task, Tuple[str, Deadline]] = {}
+        
+        def launch(name: str, extractor: BaseExtractor, run_deadline: Deadline):
+            print(f"Trying {name}...")
+            task = asyncio.create_task(self._try(platform, name, extractor, url, errors, run_deadline))
+            runs[task] = (name, run_deadline)
+        
+        launch(primary_name, primary[1], deadline.share(config.PRIMARY_BUDGET_SHARE))
+        fallback_started = False
+        hedged = False
+        try:
+            while runs:
+                timeout = hedge_delay if not fallback_started else None
+                done, _ = await asyncio.wait(runs, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    # Primary is slower than usual: speculate, or keep waiting
+                    hedge_delay = None
+                    if not self.hedge_budget.take():
+                        self.hedge_stats["hedge_denied"] += 1
+                        continue
+                    print(f"⇉ {primary_name} still running, starting {fallback_name} in parallel")
+                    self.hedge_stats["hedged"] += 1
+                    hedged = fallback_started = True
+                    launch(fallback_name, fallback[1], deadline.share(1.0))
+                    continue
+                
+                for task in done:
+                    name, _ = runs.pop(task)
+                    result = task.result()
+                    if result and result.get('formats'):
+                        print(f"✓ {name} succeeded")
+                        if hedged and name == fallback_name:
+                            self.hedge_stats["hedge_wins"] += 1
+                        return result
+                    print(f"✗ {name} failed")
+                
+                if not runs and not fallback_started:
+                    fallback_started = True
+                    launch(fallback_name, fallback[1], deadline)
+            return None
+        finally:
+            for task, (name, run_deadline) in runs.items():
+                print(f"✗ Cancelling {name}")
+                run_deadline.cancel()
+                task.cancel()
+    
+    async def _try(self, platform: str, name: str, extractor: BaseExtractor, url: str,
+                   errors: List[Exception], deadline: Deadline) -> Optional[Dict]:
+        started = time.monotonic()
+        try:
+            result = await extractor.extract(url, deadline)
+        except (ExtractionError, DeadlineExceeded) as e:
+            errors.append(e)
+            return None
         if result and result.get('formats'):
-            print(f"✓ {fallback_name} succeeded")
-            return result
+            self.latency.record(platform, name, time.monotonic() - started)
+        return result
+    
+    @staticmethod
+    def _failure_kind(errors: List[Exception]) -> Optional[str]:
+        """
+        Deterministic class for a failed extraction, None if it may be transient
         
-        # Both failed
-        raise Exception(f"All extraction methods failed for {platform}")
+        Private/unavailable/age reported by any extractor describe the video
+        itself. "Unsupported" only counts when every extractor says so.
+        """
+        kinds = [classify_error(str(e)) for e in errors]
+        for kind in ('private', 'unavailable', 'age'):
+            if kind in kinds:
+                return kind
+        if kinds and all(kind == 'unsupported' for kind in kinds):
+            return 'unsupported'
+        return None
+    
+    async def extract_preview(self, url: str) -> Optional[Dict]:
+        """
+        Phase one: title, thumbnail and duration only
+        Formats are resolved later through extract()
+        """
+        return await self.preview.extract(url, Deadline(config.PREVIEW_DEADLINE))
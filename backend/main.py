@@ -1,10 +1,31 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
-from extractors import VideoExtractorManager
+from extractors import VideoExtractorManager, ExtractionError, classify_error
 from cachetools import TTLCache
+from cache import CacheEntry, VideoCache, FailureCache
+from deadline import Deadline, DeadlineExceeded
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import urlencode
+import asyncio
 import hashlib
+import json
+import config
+import cassette
+from urls import canonicalize_url, is_playlist_url, cache_key as make_cache_key
+from warmup import PopularityTracker, CacheWarmer
+from http_client import get_client, close_client
+from prewarm import ConnectionWarmer
+from playlists import PlaylistStore, decode_cursor
+from sizes import enrich_sizes
+from archive import stream_zip, content_disposition
+from thumbnails import ThumbnailCache, snap_width, verify as verify_thumb, with_thumbnail_proxy
+from profiling import Profile, Sampler, ProfileStore, ProfilingMiddleware, LoopLagMonitor, is_admin
+
+# Record/replay upstream traffic when CASSETTE_MODE is set
+cassette.activate()
 
 # Optional DNS patch for Hugging Face Spaces
 try:
@@ -22,19 +43,204 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id"],
 )
 
-# Cache for video info (5 minute TTL, max 100 items)
-cache = TTLCache(maxsize=100, ttl=300)
+# Opt-in profiling (X-Profile header, sampling, admin sessions) and loop lag monitoring
+sampler = Sampler()
+profiles = ProfileStore()
+loop_monitor = LoopLagMonitor()
+admin_profile: Optional[Profile] = None
+app.add_middleware(ProfilingMiddleware, sampler=sampler, store=profiles)
+
+# Cache for video info (TTL follows the expiry of each result's signed URLs)
+cache = VideoCache(max_bytes=config.CACHE_MAX_BYTES)
+
+# Deterministic failures (private, deleted, age-restricted, unsupported)
+failures = FailureCache()
+
+# User-facing messages per failure class
+FAILURE_MESSAGES = {
+    'private': "This video is private and cannot be downloaded",
+    'unavailable': "This video is unavailable or has been deleted",
+    'age': "Age-restricted videos are not supported",
+    'unsupported': "Unable to download from this platform. Please try a different URL.",
+}
+
+# Status of a playlist that cannot be listed, by error class (502 otherwise: upstream failure)
+PLAYLIST_FAILURE_STATUS = {'unavailable': 404, 'private': 403, 'age': 403, 'unsupported': 422}
+
+# Metadata previews (phase one); kept longer since they hold no signed URLs
+preview_cache = TTLCache(maxsize=config.PREVIEW_CACHE_SIZE, ttl=config.PREVIEW_CACHE_TTL)
+
+# Extractions currently running, keyed like the cache (concurrent misses share one)
+inflight: Dict[str, asyncio.Task] = {}
+live_extractions = 0
+
+# Background size probes of fresh cache entries
+size_probes: Set[asyncio.Task] = set()
 
 # Initialize extractor manager
 extractor_manager = VideoExtractorManager()
 
+# Warm pooled connections to the Cobalt instances
+connections = ConnectionWarmer([config.COBALT_API_URL] + config.COBALT_FALLBACK_URLS)
+
+# Flat playlist listings
+playlists = PlaylistStore()
+
+# Resized thumbnails (memory + disk)
+thumbnails = ThumbnailCache()
+
+# Popularity tracking and background warm-up
+popularity = PopularityTracker()
+
+
+async def _extract_and_cache(url: str, key: str) -> Dict:
+    # One budget for the whole chain; requests joining this extraction share it
+    deadline = Deadline(config.REQUEST_DEADLINE)
+    try:
+        video_data = await extractor_manager.extract(url, deadline)
+    except ExtractionError as e:
+        if e.kind:
+            failures.set(key, e.kind, str(e))
+        raise
+    if video_data and video_data.get('formats'):
+        # Hand out the unpacked cache form so this response matches later cache hits
+        entry = cache.set(key, video_data)
+        video_data = entry.data
+        failures.discard(key)
+        if config.SIZE_PROBE_ENABLED and cache.entry(key) is entry:
+            _start_size_probe(key, entry)
+    return video_data
+
+
+async def _probe_sizes(key: str, entry: CacheEntry):
+    """Fill in exact sizes on a cached entry; later requests get them"""
+    data = entry.data
+    if await enrich_sizes(data['formats'], config.SIZE_PROBE_BUDGET):
+        cache.replace(key, entry, data)
+
+
+def _start_size_probe(key: str, entry: CacheEntry):
+    # Off the response path: the first request answers with estimated sizes
+    task = asyncio.create_task(_probe_sizes(key, entry))
+    size_probes.add(task)
+    task.add_done_callback(size_probes.discard)
+
+
+def _start_extraction(url: str, key: str) -> asyncio.Task:
+    """Start an extraction for url, or join the one already running"""
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_extract_and_cache(url, key))
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    return task
+
+
+def _log_refresh_result(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        print(f"✗ Refresh-ahead failed: {task.exception()}")
+
+
+def _refresh_if_due(url: str, key: str):
+    """Re-extract a hot entry in the background before its URLs expire"""
+    entry = cache.entry(key)
+    if not entry or key in inflight or not entry.refresh_due():
+        return
+    if popularity.score(url) < config.CACHE_REFRESH_MIN_SCORE:
+        return
+    print(f"↻ Refreshing {url} ahead of expiry ({entry.remaining():.0f}s left)")
+    _start_extraction(url, key).add_done_callback(_log_refresh_result)
+
+
+async def get_video_info(url: str) -> Dict:
+    """
+    Return video info for a canonical URL
+
+    Served from the cache when possible; concurrent misses for the same
+    URL wait on a single extraction instead of starting their own.
+    """
+    key = make_cache_key(url)
+    cached = cache.get(key)
+    if cached:
+        _refresh_if_due(url, key)
+        return cached
+
+    failed = failures.get(key)
+    if failed:
+        kind, message = failed
+        raise ExtractionError(message, kind=kind)
+
+    return await asyncio.shield(_start_extraction(url, key))
+
+
+async def refresh_video_info(url: str) -> Dict:
+    """Extract url again even if cached (the old entry is served meanwhile)"""
+    return await asyncio.shield(_start_extraction(url, make_cache_key(url)))
+
+
+warmer = CacheWarmer(
+    popularity,
+    fetch=refresh_video_info,
+    is_cached=lambda url: cache.is_fresh(make_cache_key(url)),
+    live_count=lambda: live_extractions,
+)
+
+
+def _base_url(request: Request) -> str:
+    return str(request.base_url).rstrip('/')
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (handles lists, weak validators and *)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(tag.replace('W/', '', 1) == etag for tag in candidates)
+
+
+def _error_detail(error: Exception) -> str:
+    """User-friendly message for a failed extraction"""
+    kind = getattr(error, 'kind', None)
+    if kind in FAILURE_MESSAGES:
+        return FAILURE_MESSAGES[kind]
+    
+    error_msg = str(error)
+    if "private" in error_msg.lower():
+        return FAILURE_MESSAGES['private']
+    elif "unavailable" in error_msg.lower():
+        return FAILURE_MESSAGES['unavailable']
+    elif "age" in error_msg.lower():
+        return FAILURE_MESSAGES['age']
+    elif "All extraction methods failed" in error_msg:
+        return FAILURE_MESSAGES['unsupported']
+    return f"Failed to extract video: {error_msg}"
+
 
 class VideoRequest(BaseModel):
     url: str
 
 
+@app.on_event("startup")
+async def startup_event():
+    if config.PREWARM_ENABLED:
+        connections.start()
+    if config.WARMUP_ENABLED:
+        warmer.start()
+    loop_monitor.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if config.WARMUP_ENABLED:
+        await warmer.stop()
+    await connections.stop()
+    loop_monitor.stop()
+    await close_client()
+
+
 @app.get("/")
 async def health_check():
     """Health check endpoint"""
@@ -49,8 +255,6 @@ async def health_check():
 @app.get("/api/health")
 async def detailed_health():
     """Detailed health check with service status"""
-    import httpx
-    
     status = {
         "backend": "operational",
         "cobalt_api": "checking...",
@@ -59,25 +263,31 @@ async def detailed_health():
     
     # Check Cobalt API
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            response = await client.get("https://api.cobalt.tools/")
-            status["cobalt_api"] = "operational" if response.status_code == 200 else "degraded"
+        response = await get_client().get("https://api.cobalt.tools/", timeout=5)
+        status["cobalt_api"] = "operational" if response.status_code == 200 else "degraded"
     except:
         status["cobalt_api"] = "unavailable"
     
+    status["hedging"] = extractor_manager.hedge_stats
+    status["cache"] = cache.stats()
     return status
 
 
-@app.post("/api/download")
-async def extract_video_info(video_request: VideoRequest):
+@app.get("/api/connections")
+async def connection_report():
+    """Per-host DNS, TCP and TLS setup times and connections reused by the last keep-alive round"""
+    return connections.stats()
+
+
+async def lookup_video(raw_url: str) -> Tuple[str, Dict]:
     """
-    Extract video information from URL
+    Validate, canonicalize and resolve a URL for the info endpoints
     
-    Supports: YouTube, TikTok, Instagram, Facebook, Twitter, Reddit
-    Uses: Cobalt API (primary for social media) + yt-dlp (fallback)
+    Returns (canonical URL, video info); raises HTTPException with a
+    user-facing message on failure.
     """
     
-    url = video_request.url.strip()
+    url = raw_url.strip()
     
     if not url:
         raise HTTPException(status_code=400, detail="URL is required")
@@ -86,19 +296,39 @@ async def extract_video_info(video_request: VideoRequest):
     if not url.startswith(('http://', 'https://')):
         raise HTTPException(status_code=400, detail="Invalid URL format")
     
+    url = canonicalize_url(url)
+    
+    if is_playlist_url(url):
+        raise HTTPException(
+            status_code=400,
+            detail="This link is a playlist or channel. Use /api/playlist to list its videos."
+        )
+    
+    popularity.record(url)
+    
     # Check cache
-    cache_key = hashlib.md5(url.encode()).hexdigest()
-    if cache_key in cache:
+    cache_key = make_cache_key(url)
+    cached = cache.get(cache_key)
+    if cached:
         print(f"✓ Cache hit for {url}")
-        return cache[cache_key]
+        _refresh_if_due(url, cache_key)
+        return url, cached
+    
+    # Known dead link: answer from the failure cache
+    failed = failures.get(cache_key)
+    if failed:
+        print(f"✓ Failure cache hit for {url} ({failed[0]})")
+        raise HTTPException(status_code=400, detail=FAILURE_MESSAGES[failed[0]])
     
+    global live_extractions
+    live_extractions += 1
     try:
         print(f"\n{'='*60}")
         print(f"Processing URL: {url}")
         print(f"{'='*60}")
         
-        # Extract using multi-strategy manager
-        video_data = await extractor_manager.extract(url)
+        # Extract using multi-strategy manager (shared with concurrent requests)
+        video_data = await get_video_info(url)
         
         # Validate response
         if not video_data or not video_data.get('formats'):
@@ -107,39 +337,310 @@ async def extract_video_info(video_request: VideoRequest):
                 detail="No downloadable formats found. The video might be private or unavailable."
             )
         
-        # Cache the result
-        cache[cache_key] = video_data
-        
         print(f"✓ Successfully extracted {len(video_data['formats'])} formats")
-        return video_data
+        return url, video_data
         
     except HTTPException:
         raise
+    except DeadlineExceeded as e:
+        print(f"✗ Extraction timed out: {str(e)}")
+        raise HTTPException(
+            status_code=504,
+            detail=f"Extraction took longer than {e.budget:.0f}s (stopped during {e.stage}). Please try again."
+        )
     except Exception as e:
-        error_msg = str(e)
-        print(f"✗ Extraction failed: {error_msg}")
+        print(f"✗ Extraction failed: {str(e)}")
         
         # User-friendly error messages
-        if "private" in error_msg.lower():
-            detail = "This video is private and cannot be downloaded"
-        elif "unavailable" in error_msg.lower():
-            detail = "This video is unavailable or has been deleted"
-        elif "age" in error_msg.lower():
-            detail = "Age-restricted videos are not supported"
-        elif "All extraction methods failed" in error_msg:
-            detail = "Unable to download from this platform. Please try a different URL."
-        else:
-            detail = f"Failed to extract video: {error_msg}"
-        
-        raise HTTPException(status_code=400, detail=detail)
+        raise HTTPException(status_code=400, detail=_error_detail(e))
+    finally:
+        live_extractions -= 1
+
+
+@app.post("/api/download")
+async def extract_video_info(video_request: VideoRequest, request: Request):
+    """
+    Extract video information from URL
+    
+    Supports: YouTube, TikTok, Instagram, Facebook, Twitter, Reddit
+    Uses: Cobalt API (primary for social media) + yt-dlp (fallback)
+    """
+    
+    _, video_data = await lookup_video(video_request.url)
+    return with_thumbnail_proxy(video_data, _base_url(request))
+
+
+@app.get("/api/info")
+async def cacheable_video_info(request: Request, url: str = Query(...)):
+    """
+    Cacheable GET variant of /api/download
+    
+    Keyed on the canonical URL. Returns an ETag (hash of the payload) and a
+    Cache-Control max-age equal to the cache entry's remaining lifetime, so
+    browsers and edge caches can reuse the result; If-None-Match gets a 304.
+    """
+    
+    canonical, video_data = await lookup_video(url)
+    payload = with_thumbnail_proxy(video_data, _base_url(request))
+    
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    
+    entry = cache.entry(make_cache_key(canonical))
+    max_age = max(0, int(entry.remaining())) if entry else 0
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}",
+        "Content-Location": f"/api/info?{urlencode({'url': canonical})}",
+    }
+    
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.post("/api/preview")
+async def preview_video_info(video_request: VideoRequest, request: Request):
+    """
+    Fast metadata preview (title, thumbnail, duration)
+    
+    Formats are not resolved here; fetch them with /api/download once the
+    user actually wants to download. When the full result is already
+    cached it is returned directly with formats_pending = false. 404 means
+    this link has no cheap preview (use /api/download directly).
+    """
+    
+    url = video_request.url.strip()
+    
+    if not url:
+        raise HTTPException(status_code=400, detail="URL is required")
+    
+    if not url.startswith(('http://', 'https://')):
+        raise HTTPException(status_code=400, detail="Invalid URL format")
+    
+    url = canonicalize_url(url)
+    cache_key = make_cache_key(url)
+    
+    cached = cache.get(cache_key)
+    if cached:
+        return with_thumbnail_proxy({**cached, "formats_pending": False}, _base_url(request))
+    
+    preview = preview_cache.get(cache_key)
+    if not preview:
+        try:
+            preview = await extractor_manager.extract_preview(url)
+        except DeadlineExceeded as e:
+            print(f"✗ Preview timed out: {str(e)}")
+            raise HTTPException(status_code=504, detail="Loading the preview took too long. Please try again.")
+        except ExtractionError as e:
+            print(f"✗ Preview failed: {str(e)}")
+            raise HTTPException(status_code=400, detail=_error_detail(e))
+        if not preview:
+            # Not an error: the client goes straight to /api/download
+            raise HTTPException(status_code=404, detail="No preview available for this URL")
+        preview_cache[cache_key] = preview
+    
+    return with_thumbnail_proxy(preview, _base_url(request))
+
+
+@app.get("/api/zip")
+async def download_zip(url: str = Query(...), items: str = Query(None)):
+    """
+    Every item of a multi-item post (carousel, multi-media tweet) as one ZIP
+    
+    items picks a subset by 1-based position ("1,3,4"). The archive is
+    streamed while later items are still downloading.
+    """
+    
+    _, video_data = await lookup_video(url)
+    picker = video_data.get('picker')
+    if not picker:
+        raise HTTPException(
+            status_code=400,
+            detail="This post has a single item. Download it from the formats list."
+        )
+    
+    if items:
+        try:
+            positions = sorted({int(p) for p in items.split(',') if p.strip()})
+        except ValueError:
+            raise HTTPException(status_code=400, detail="items must be comma-separated numbers")
+        if not positions or positions[0] < 1 or positions[-1] > len(picker):
+            raise HTTPException(status_code=400, detail=f"items must be between 1 and {len(picker)}")
+        picker = [picker[p - 1] for p in positions]
+    picker = picker[:config.ZIP_MAX_ITEMS]
+    
+    print(f"⇉ Streaming ZIP of {len(picker)} items for {url}")
+    return StreamingResponse(
+        stream_zip(picker),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(video_data.get("title"))}
+    )
+
+
+@app.get("/api/playlist")
+async def list_playlist(
+    url: str = Query(...),
+    cursor: str = Query(None),
+    limit: int = Query(config.PLAYLIST_PAGE_SIZE, ge=1, le=config.PLAYLIST_MAX_PAGE_SIZE)
+):
+    """
+    List a playlist or channel page by page (NDJSON stream)
+    
+    Lines: one "playlist" header, one "entry" per video, then a "page" line
+    with next_cursor (null on the last page). Entries are not resolved;
+    post an entry's url to /api/download to get its formats. A playlist
+    that cannot be opened gets an HTTP error status; a failure once the
+    stream has started ends it with an "error" line.
+    """
+    
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        raise HTTPException(status_code=400, detail="Invalid URL format")
+    
+    try:
+        decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        lines = await playlists.open_page(canonicalize_url(url), cursor, limit)
+    except Exception as e:
+        print(f"✗ Playlist listing failed for {url}: {str(e)}")
+        kind = getattr(e, 'kind', None) or classify_error(str(e))
+        raise HTTPException(
+            status_code=PLAYLIST_FAILURE_STATUS.get(kind, 502),
+            detail=f"Failed to list playlist: {str(e)}"
+        )
+    
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+@app.get("/api/thumb")
+async def thumbnail_proxy(
+    request: Request,
+    src: str = Query(...),
+    sig: str = Query(...),
+    w: int = Query(None, ge=1)
+):
+    """
+    Resized thumbnail for a URL from an extraction result
+    
+    Only signed sources (URLs we handed out) are fetched. Widths snap up
+    to config.THUMB_WIDTHS; responses carry an ETag and honour If-None-Match.
+    """
+    
+    if not verify_thumb(src, sig):
+        raise HTTPException(status_code=403, detail="Invalid thumbnail signature")
+    
+    try:
+        content, content_type, etag = await thumbnails.get(src, snap_width(w))
+    except Exception as e:
+        print(f"✗ Thumbnail failed for {src}: {str(e)}")
+        raise HTTPException(status_code=502, detail="Thumbnail unavailable")
+    
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={config.THUMB_MAX_AGE}, immutable"
+    }
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=content, media_type=content_type, headers=headers)
 
 
 @app.get("/api/clear-cache")
 async def clear_cache():
     """Clear the video info cache (admin endpoint)"""
     cache.clear()
+    failures.clear()
+    preview_cache.clear()
     return {"status": "ok", "message": "Cache cleared"}
 
 
+@app.get("/api/popular")
+async def popular_urls():
+    """Most requested URLs and warm-up status (admin endpoint)"""
+    return {
+        "top": [
+            {"url": url, "score": round(popularity.top[url], 2), "cached": make_cache_key(url) in cache}
+            for url in popularity.hottest()
+        ],
+        "warmup": warmer.stats
+    }
+
+
+def _require_admin(request: Request):
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def _stop_admin_profile() -> Optional[Profile]:
+    global admin_profile
+    profile, admin_profile = admin_profile, None
+    if profile:
+        sampler.stop(profile)
+        profiles.save(profile)
+    return profile
+
+
+@app.post("/api/admin/profile/start")
+async def start_profile(request: Request, seconds: int = Query(60, ge=1, le=config.PROFILE_MAX_SECONDS)):
+    """Sample every thread of this worker until stopped (or for `seconds`)"""
+    global admin_profile
+    _require_admin(request)
+    if admin_profile:
+        raise HTTPException(status_code=409, detail=f"Profile {admin_profile.id} is already running")
+    
+    profile = sampler.start(Profile("worker", loop=asyncio.get_running_loop()))
+    admin_profile = profile
+    asyncio.get_running_loop().call_later(
+        seconds, lambda: admin_profile is profile and _stop_admin_profile()
+    )
+    return {"status": "started", "profile_id": profile.id, "seconds": seconds}
+
+
+@app.post("/api/admin/profile/stop")
+async def stop_profile(request: Request):
+    """Stop the running session and return its folded stacks"""
+    _require_admin(request)
+    profile = _stop_admin_profile()
+    if not profile:
+        raise HTTPException(status_code=404, detail="No profile is running")
+    return PlainTextResponse(profile.folded(), headers={"X-Profile-Id": profile.id})
+
+
+@app.get("/api/admin/profiles")
+async def list_profiles(request: Request):
+    """Stored profiles, newest first"""
+    _require_admin(request)
+    return {"profiles": profiles.list()}
+
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    """Folded stacks of a stored profile (flamegraph.pl / speedscope input)"""
+    _require_admin(request)
+    folded = profiles.load(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(folded)
+
+
+@app.get("/api/admin/loop-lag")
+async def loop_lag(request: Request, threshold_ms: int = Query(None, ge=0)):
+    """
+    Event-loop stalls seen so far
+    threshold_ms starts the monitor with that threshold; 0 stops it.
+    """
+    _require_admin(request)
+    if threshold_ms == 0:
+        loop_monitor.stop()
+    elif threshold_ms:
+        loop_monitor.start(threshold_ms / 1000)
+    return loop_monitor.stats()
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,5 +1,4 @@
 import socket
-import requests
 import json
 import ssl
 
@@ -18,6 +17,9 @@ def resolve_doh(hostname):
     if hostname in dns_cache:
         return dns_cache[hostname]
 
+    # Imported on first lookup so that applying the patch stays cheap at startup
+    import requests
+
     try:
         # verify=False because the Cert matches dns.google, not 8.8.8.8
         # This is safe because we trust the hardcoded IP 8.8.8.8 to be Google.
@@ -67,6 +69,9 @@ def patched_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
     return original_getaddrinfo(host, port, family, type, proto, flags)
 
 def patch():
+    # Idempotent: applying the patch twice must not wrap it again or re-log
+    if socket.getaddrinfo is patched_getaddrinfo:
+        return
     print("PATCH: Applying blocked-port-resilient DNS patch (DoH via 8.8.8.8)")
     # Monkey patch
     socket.getaddrinfo = patched_getaddrinfo
@@ -0,0 +1,200 @@
+"""
+Playlists - flat, paginated and lazily resolved playlist/channel entries
+Entries are listed without resolving any formats; each entry's formats are
+fetched on demand through /api/download (normal cache + coalescing path)
+"""
+
+import asyncio
+import base64
+import json
+import random
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set
+from cachetools import TTLCache
+import config
+from extractors import ExtractionError
+
+
+def encode_cursor(offset: int) -> str:
+    raw = json.dumps({"o": offset}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """Cursor to entry offset (raises ValueError on a malformed cursor)"""
+    if not cursor:
+        return 0
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(padded))["o"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+def _entry_summary(entry: Dict) -> Dict:
+    thumbnails = entry.get('thumbnails') or []
+    url = entry.get('url') or entry.get('webpage_url')
+    if url and not url.startswith(('http://', 'https://')) and entry.get('ie_key') == 'Youtube':
+        url = f"https://www.youtube.com/watch?v={entry.get('id')}"
+    return {
+        "id": entry.get('id'),
+        "title": entry.get('title'),
+        "url": url,
+        "duration": entry.get('duration'),
+        "thumbnail": entry.get('thumbnail') or (thumbnails[-1].get('url') if thumbnails else None),
+    }
+
+
+class PlaylistSession:
+    """
+    One flat-extracted playlist
+
+    Holds the playlist metadata, the entries listed so far and the live
+    yt-dlp entry iterator, so a later page continues where the previous
+    one stopped instead of walking the playlist from the start again.
+    """
+
+    def __init__(self, info: Dict):
+        self.meta = {
+            "id": info.get('id'),
+            "title": info.get('title'),
+            "uploader": info.get('uploader') or info.get('channel'),
+            "platform": info.get('extractor_key'),
+            "entry_count": info.get('playlist_count'),
+        }
+        self.entries: List[Dict] = []
+        self._iterator: Optional[Iterator] = iter(info.get('entries') or [])
+        self.exhausted = False
+        self.lock = asyncio.Lock()
+        self._pulls: Set[asyncio.Task] = set()
+
+    def _pull(self, count: int) -> List[Dict]:
+        """Read up to count more entries from yt-dlp (blocking, runs in a thread)"""
+        pulled = []
+        for entry in self._iterator:
+            if entry:
+                pulled.append(_entry_summary(entry))
+            if len(pulled) >= count:
+                break
+        else:
+            self.exhausted = True
+        return pulled
+
+    async def page(self, offset: int, limit: int) -> AsyncIterator[Dict]:
+        """Yield entries [offset, offset + limit) as soon as each batch is listed"""
+        end = offset + limit
+        position = offset
+        while True:
+            # A copy taken between awaits: extend() never runs halfway through it
+            ready = self.entries[position:end]
+            for entry in ready:
+                yield entry
+            position += len(ready)
+            if position >= end or (self.exhausted and position >= len(self.entries)):
+                return
+            # Shielded: a client leaving mid-pull must not lose the batch the
+            # thread has already taken from the shared yt-dlp iterator
+            task = asyncio.create_task(self._extend(end))
+            self._pulls.add(task)
+            task.add_done_callback(self._pulls.discard)
+            await asyncio.shield(task)
+
+    async def _extend(self, end: int):
+        """List the next batch towards end (one pull at a time; never held across a yield)"""
+        async with self.lock:
+            if len(self.entries) < end and not self.exhausted:
+                batch_size = min(config.PLAYLIST_FETCH_BATCH, end - len(self.entries))
+                self.entries.extend(await asyncio.to_thread(self._pull, batch_size))
+
+    def next_offset(self, offset: int, limit: int) -> Optional[int]:
+        end = offset + limit
+        if self.exhausted and len(self.entries) <= end:
+            return None
+        return end
+
+
+class PlaylistStore:
+    """Playlist sessions by canonical URL (flat extraction done once per TTL)"""
+
+    def __init__(self):
+        self.sessions = TTLCache(maxsize=config.PLAYLIST_CACHE_SIZE, ttl=config.PLAYLIST_CACHE_TTL)
+        self._opening: Dict[str, asyncio.Task] = {}
+
+    async def get(self, url: str) -> PlaylistSession:
+        if url in self.sessions:
+            return self.sessions[url]
+
+        task = self._opening.get(url)
+        if task is None:
+            task = asyncio.create_task(self._open(url))
+            self._opening[url] = task
+            task.add_done_callback(lambda _: self._opening.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def _open(self, url: str) -> PlaylistSession:
+        info = await asyncio.to_thread(self._extract_flat, url)
+        if not info or info.get('_type') not in ('playlist', 'multi_video'):
+            raise ExtractionError("URL is not a playlist or channel", kind='unsupported')
+        session = PlaylistSession(info)
+        self.sessions[url] = session
+        return session
+
+    @staticmethod
+    def _extract_flat(url: str) -> Optional[Dict]:
+        import yt_dlp
+
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            'socket_timeout': config.TIMEOUT,
+            'user_agent': random.choice(config.USER_AGENTS),
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # process=False keeps 'entries' as yt-dlp's lazy generator/paged list
+            return ydl.extract_info(url, download=False, process=False)
+
+    async def open_page(self, url: str, cursor: Optional[str], limit: int) -> AsyncIterator[bytes]:
+        """
+        NDJSON lines for one page: playlist header, one line per entry, then the next cursor
+
+        The playlist is opened and the page's first entry listed before this
+        returns, so those failures raise here, while the caller can still
+        answer with an HTTP error; later ones end the stream with an "error" line.
+        """
+        offset = decode_cursor(cursor)
+        started = time.monotonic()
+        session = await self.get(url)
+        entries = session.page(offset, limit)
+        first = await anext(entries, None)
+        return self._stream_page(url, session, entries, first, offset, limit, started)
+
+    async def _stream_page(self, url: str, session: PlaylistSession, entries: AsyncIterator[Dict],
+                           first: Optional[Dict], offset: int, limit: int, started: float) -> AsyncIterator[bytes]:
+        def line(obj: Dict) -> bytes:
+            return (json.dumps(obj) + "\n").encode()
+
+        try:
+            yield line({"type": "playlist", **session.meta})
+
+            index = offset
+            if first is not None:
+                yield line({"type": "entry", "index": index, **first})
+                index += 1
+                async for entry in entries:
+                    yield line({"type": "entry", "index": index, **entry})
+                    index += 1
+
+            next_offset = session.next_offset(offset, limit)
+            yield line({
+                "type": "page",
+                "next_cursor": encode_cursor(next_offset) if next_offset is not None else None,
+                "elapsed_ms": round((time.monotonic() - started) * 1000)
+            })
+        except Exception as e:
+            print(f"Playlist listing failed for {url}: {str(e)}")
+            yield line({"type": "error", "detail": f"Failed to list playlist: {str(e)}"})
@@ -0,0 +1,180 @@
+"""
+Connection pre-warming - pooled connections to known upstreams, opened
+ahead of demand
+At startup every host is resolved (timed; with patch_dns this also fills
+its DoH cache) and PREWARM_MIN_IDLE connections are opened on the shared
+client. Keep-alive rounds then touch each host every PREWARM_INTERVAL
+seconds, so its connections never sit idle long enough to expire; they
+pause once no upstream request was made for PREWARM_IDLE_STOP seconds
+"""
+
+import asyncio
+import socket
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+import config
+import http_client
+from http_client import get_client
+
+
+class HostStats:
+    """Setup latency and warm-up results for one upstream host"""
+
+    __slots__ = ('host', 'dns_ms', 'tcp_ms', 'tls_ms', 'opened', 'setup_ms_total',
+                 'reused', 'rounds', 'failures', 'last_error', 'last_warmed')
+
+    def __init__(self, host: str):
+        self.host = host
+        self.dns_ms: Optional[float] = None
+        self.tcp_ms: Optional[float] = None
+        self.tls_ms: Optional[float] = None
+        self.opened = 0  # connections this warmer has set up
+        self.setup_ms_total = 0.0
+        self.reused: Optional[int] = None  # connections of the last round that were already open
+        self.rounds = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_warmed: Optional[float] = None
+
+    def as_dict(self) -> Dict:
+        return {
+            "dns_ms": self.dns_ms,
+            "tcp_ms": self.tcp_ms,
+            "tls_ms": self.tls_ms,
+            "avg_setup_ms": round(self.setup_ms_total / self.opened, 1) if self.opened else None,
+            "connections_opened": self.opened,
+            "reused_connections": self.reused,
+            "rounds": self.rounds,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_warmed": self.last_warmed,
+        }
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def _port(parsed) -> int:
+    return parsed.port or (443 if parsed.scheme == 'https' else 80)
+
+
+class ConnectionWarmer:
+    """
+    Keeps min_idle pooled connections open per upstream host
+
+    Each round sends min_idle concurrent HEAD requests per host: idle
+    connections are reused (which restarts their keep-alive timer) and the
+    pool opens new ones for the rest. Connection setup is timed through
+    httpcore's trace events (TCP connect, TLS handshake). After the first
+    round, rounds only run while the app made an upstream request within
+    idle_stop seconds; an idle server lets its connections expire.
+    """
+
+    def __init__(self, urls: List[str], min_idle: int = config.PREWARM_MIN_IDLE,
+                 interval: float = config.PREWARM_INTERVAL, idle_stop: float = config.PREWARM_IDLE_STOP):
+        self.origins: List[str] = []
+        for url in urls:
+            parsed = urlparse(url)
+            origin = f"{parsed.scheme}://{parsed.netloc}"
+            if parsed.hostname and origin not in self.origins:
+                self.origins.append(origin)
+        self.min_idle = min_idle
+        self.interval = interval
+        self.idle_stop = idle_stop
+        self.hosts: Dict[str, HostStats] = {urlparse(o).netloc: HostStats(urlparse(o).hostname) for o in self.origins}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def paused(self) -> bool:
+        return time.monotonic() - http_client.last_request_at > self.idle_stop
+
+    async def _run(self):
+        await self.warm()
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.paused:
+                await self.warm()
+
+    async def warm(self):
+        """One round over every host (the first one also resolves them)"""
+        started = time.monotonic()
+        await asyncio.gather(*(self._warm_host(origin) for origin in self.origins))
+        if all(stats.rounds == 1 for stats in self.hosts.values()):
+            ready = sum(1 for stats in self.hosts.values() if stats.last_error is None)
+            print(f"✓ Pre-warmed {ready}/{len(self.hosts)} upstream hosts in {_ms(time.monotonic() - started):.0f} ms")
+
+    async def _warm_host(self, origin: str):
+        parsed = urlparse(origin)
+        stats = self.hosts[parsed.netloc]
+        stats.rounds += 1
+        try:
+            if stats.dns_ms is None:
+                stats.dns_ms = await self._resolve(parsed.hostname, _port(parsed))
+            opened = await asyncio.gather(*(self._touch(origin, stats) for _ in range(self.min_idle)))
+            stats.reused = opened.count(False)
+            stats.last_error = None
+            stats.last_warmed = time.time()
+        except Exception as e:
+            if stats.last_error is None:
+                print(f"✗ Pre-warm of {stats.host} failed: {str(e)}")
+            stats.failures += 1
+            stats.last_error = str(e) or type(e).__name__
+
+    @staticmethod
+    async def _resolve(host: str, port: int) -> float:
+        started = time.monotonic()
+        # socket.getaddrinfo is looked up at call time, so a patch_dns patch applies
+        await asyncio.to_thread(socket.getaddrinfo, host, port, 0, socket.SOCK_STREAM)
+        return _ms(time.monotonic() - started)
+
+    async def _touch(self, origin: str, stats: HostStats) -> bool:
+        """HEAD / on a pooled connection, timing its setup if a new one was opened (True then)"""
+        marks: Dict[str, float] = {}
+
+        async def trace(event: str, info: Dict):
+            if event.startswith(("connection.connect_tcp.", "connection.start_tls.")):
+                marks[event] = time.monotonic()
+
+        # "prewarm" keeps these requests out of http_client.last_request_at
+        await get_client().head(f"{origin}/", timeout=config.PREWARM_TIMEOUT,
+                                extensions={"trace": trace, "prewarm": True})
+
+        tcp = self._span(marks, "connection.connect_tcp")
+        if tcp is None:
+            return False  # an idle connection was reused
+        tls = self._span(marks, "connection.start_tls")
+        stats.tcp_ms = _ms(tcp)
+        stats.tls_ms = _ms(tls) if tls is not None else None
+        stats.opened += 1
+        stats.setup_ms_total += _ms(tcp + (tls or 0))
+        return True
+
+    @staticmethod
+    def _span(marks: Dict[str, float], name: str) -> Optional[float]:
+        if f"{name}.started" in marks and f"{name}.complete" in marks:
+            return marks[f"{name}.complete"] - marks[f"{name}.started"]
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "paused": self.paused,
+            "min_idle": self.min_idle,
+            "interval": self.interval,
+            "idle_stop": self.idle_stop,
+            "hosts": {stats.host: stats.as_dict() for stats in self.hosts.values()},
+        }
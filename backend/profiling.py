@@ -0,0 +1,374 @@
+"""
+Profiling - opt-in sampling profiles and event-loop lag monitoring
+Profiles are wall-clock stack samples written as folded stacks (one
+"frame;frame;frame count" line per stack), ready for flamegraph.pl or
+speedscope
+"""
+
+import asyncio
+import contextvars
+import hmac
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import Counter
+from typing import Dict, List, Optional
+import config
+
+
+# The request profile whose task is running (inherited by the tasks it creates)
+_request_profile: contextvars.ContextVar = contextvars.ContextVar("request_profile", default=None)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Whether token matches ADMIN_TOKEN (always False when none is configured)"""
+    return bool(config.ADMIN_TOKEN) and hmac.compare_digest(token or "", config.ADMIN_TOKEN)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _thread_stack(frame) -> List[str]:
+    """Labels of a thread's frames, outermost first"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _task_stack(task: asyncio.Task) -> List[str]:
+    """
+    Labels along a task's await chain, outermost first
+
+    A suspended coroutine has no thread frame, so this is what makes time
+    spent awaiting (HTTP calls, worker threads) show up in the profile.
+    """
+    labels = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = (getattr(awaitable, 'cr_frame', None)
+                 or getattr(awaitable, 'gi_frame', None)
+                 or getattr(awaitable, 'ag_frame', None))
+        if frame is None:
+            if isinstance(awaitable, asyncio.Future):
+                labels.append("<awaiting future>")
+            break
+        labels.append(_frame_label(frame))
+        awaitable = (getattr(awaitable, 'cr_await', None)
+                     or getattr(awaitable, 'gi_yieldfrom', None)
+                     or getattr(awaitable, 'ag_await', None))
+    return labels
+
+
+def _track_request_tasks(loop: asyncio.AbstractEventLoop):
+    """
+    Install a task factory adding every task created under a request
+    profile to that profile (once per loop; wraps any existing factory)
+    """
+    previous = loop.get_task_factory()
+    if getattr(previous, "tracks_profiles", False):
+        return
+
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        context = kwargs.get("context")
+        profile = context.get(_request_profile) if context is not None else _request_profile.get()
+        if profile is not None and profile.finished is None:
+            profile.tasks.add(task)
+        return task
+
+    factory.tracks_profiles = True
+    loop.set_task_factory(factory)
+
+
+class Profile:
+    """
+    Folded-stack samples collected for one request or one admin session
+
+    With a task the profile covers that request only: its task, the tasks
+    it started, and the loop thread while one of those runs. Without one
+    (loop only) it covers every task and thread of the worker.
+    """
+
+    def __init__(self, name: str, task: Optional[asyncio.Task] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.name = name
+        self.task = task
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet([task] if task else [])
+        self.thread = threading.get_ident() if task else None  # the loop's thread
+        self.loop = loop or (task.get_loop() if task else None)
+        self.started = time.time()
+        self.id = f"{int(self.started * 1000)}-{secrets.token_hex(2)}"
+        self.finished: Optional[float] = None
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Sampler:
+    """
+    Background thread sampling thread stacks and task await chains every
+    PROFILE_INTERVAL seconds while at least one profile is active (what
+    each profile keeps is described on Profile)
+    """
+
+    def __init__(self, interval: float = config.PROFILE_INTERVAL):
+        self.interval = interval
+        self.active: Dict[int, Profile] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, profile: Profile) -> Profile:
+        with self._lock:
+            self.active[id(profile)] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, profile: Profile) -> Profile:
+        with self._lock:
+            self.active.pop(id(profile), None)
+        profile.finished = time.time()
+        return profile
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                profiles = list(self.active.values())
+                if not profiles:
+                    self._thread = None
+                    return
+
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            threads = {
+                ident: f"thread:{names.get(ident, ident)};" + ";".join(_thread_stack(frame))
+                for ident, frame in frames.items() if ident != own_id
+            }
+
+            for profile in profiles:
+                profile.samples += 1
+                for stack in self._thread_stacks(profile, threads):
+                    profile.stacks[stack] += 1
+                for stack in self._task_stacks(profile):
+                    profile.stacks[stack] += 1
+
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _request_tasks(profile: Profile) -> List[asyncio.Task]:
+        while True:
+            try:
+                return list(profile.tasks)
+            except RuntimeError:
+                continue  # the loop thread added a task meanwhile
+
+    @classmethod
+    def _thread_stacks(cls, profile: Profile, threads: Dict[int, str]) -> List[str]:
+        if profile.task is None:
+            return list(threads.values())
+        # Worker threads cannot be told apart by request; their time shows
+        # in the task stacks as the frame awaiting them
+        running = asyncio.current_task(profile.loop) if profile.loop else None
+        if profile.thread in threads and running in cls._request_tasks(profile):
+            return [threads[profile.thread]]
+        return []
+
+    @classmethod
+    def _task_stacks(cls, profile: Profile) -> List[str]:
+        if profile.loop is None or profile.loop.is_closed():
+            return []
+        stacks = []
+        try:
+            tasks = asyncio.all_tasks(profile.loop) if profile.task is None else cls._request_tasks(profile)
+        except RuntimeError:
+            return []
+        for task in tasks:
+            try:
+                chain = _task_stack(task)
+            except Exception:
+                continue  # the chain changed under us; skip this sample
+            if chain:
+                root = profile.name if task is profile.task else task.get_name()
+                stacks.append(f"task:{root};" + ";".join(chain))
+        return stacks
+
+
+class ProfileStore:
+    """Finished profiles on disk, newest PROFILE_KEEP kept"""
+
+    def __init__(self, directory: str = config.PROFILE_DIR):
+        self.directory = directory
+
+    def save(self, profile: Profile):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{profile.id}.folded"), "w") as f:
+                f.write(profile.folded())
+        except OSError as e:
+            print(f"Profile write failed: {e}")
+            return
+        self._prune()
+
+    def load(self, profile_id: str) -> Optional[str]:
+        if not profile_id.replace("-", "").isalnum():
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.folded")) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def list(self) -> List[str]:
+        try:
+            names = sorted(os.listdir(self.directory), reverse=True)
+        except OSError:
+            return []
+        return [name[:-len(".folded")] for name in names if name.endswith(".folded")]
+
+    def _prune(self):
+        for profile_id in self.list()[config.PROFILE_KEEP:]:
+            try:
+                os.remove(os.path.join(self.directory, f"{profile_id}.folded"))
+            except OSError:
+                pass
+
+
+class LoopLagMonitor:
+    """
+    Event-loop lag monitor
+
+    A heartbeat coroutine stamps the time every interval; a watchdog thread
+    notices when the stamp goes stale for longer than the threshold and
+    logs the loop thread's stack while the blocking callback is still running.
+    """
+
+    def __init__(self, threshold: float = config.LOOP_LAG_THRESHOLD_MS / 1000):
+        self.threshold = threshold
+        self.interval = min(threshold / 2, 0.05) if threshold else 0.05
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.recent: List[Dict] = []
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, threshold: Optional[float] = None):
+        """Start monitoring from the loop's thread (threshold in seconds)"""
+        if threshold:
+            self.stop()
+            self.threshold = threshold
+            self.interval = min(threshold / 2, 0.05)
+        if self.running or not self.threshold:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop = threading.Event()
+        self._task = asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, args=(self._stop,), name="loop-watchdog", daemon=True).start()
+        print(f"✓ Loop lag monitor started (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - expected
+            self.max_lag = max(self.max_lag, lag)
+            self._beat = time.monotonic()
+
+    def _watch(self, stopped: threading.Event):
+        reported = None
+        while not stopped.wait(self.interval):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or beat == reported:
+                continue
+            # Report each stall once, with the stack of whatever is blocking
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            self.stalls += 1
+            self.recent = (self.recent + [{
+                "at": time.time(),
+                "blocked_ms": round(stalled * 1000),
+                "stack": _thread_stack(frame) if frame else [],
+            }])[-20:]
+            print(f"⚠ Event loop blocked for {stalled * 1000:.0f} ms:\n{stack}")
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "threshold_ms": round(self.threshold * 1000),
+            "stalls": self.stalls,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "recent": self.recent,
+        }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling single requests
+
+    A request is profiled when it carries "X-Profile: 1" with a valid
+    X-Admin-Token, or at random with probability PROFILE_SAMPLE_RATE. It
+    runs the app in the request's own task, so the await chain sampled is
+    the endpoint's; tasks the request starts are tracked through a task
+    factory, other requests on the loop are left out. The response gets an
+    X-Profile-Id header; the folded stacks are at /api/admin/profiles/{id}.
+    """
+
+    def __init__(self, app, sampler: Sampler, store: ProfileStore):
+        self.app = app
+        self.sampler = sampler
+        self.store = store
+
+    def _wanted(self, scope) -> bool:
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"x-profile") and is_admin(headers.get(b"x-admin-token", b"").decode()):
+            return True
+        return random.random() < config.PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        _track_request_tasks(asyncio.get_running_loop())
+        profile = self.sampler.start(Profile(f"{scope['method']} {scope['path']}", asyncio.current_task()))
+        token = _request_profile.set(profile)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers") or []) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _request_profile.reset(token)
+            self.sampler.stop(profile)
+            self.store.save(profile)
@@ -54,9 +54,32 @@ def test_download(url, platform_name):
         print(f"❌ ERROR: {str(e)}")
         return False
 
+def test_retry_sleep_functions():
+    """Offline: yt-dlp calls retry sleep functions as sleep_func(n=...)"""
+    print("\n" + "="*60)
+    print("Testing yt-dlp retry backoff")
+    print("="*60)
+    
+    from yt_dlp.utils import RetryManager
+    from extractors import RETRY_SLEEP_FUNCTIONS
+    
+    try:
+        for name, sleep_func in RETRY_SLEEP_FUNCTIONS.items():
+            # The same call yt-dlp makes before its first retry
+            RetryManager.report_retry(Exception("test"), 1, 3, sleep_func=sleep_func,
+                                      info=lambda msg: None, warn=lambda msg: None)
+            print(f"✅ {name}: delay {sleep_func(n=0):.2f}s")
+        return True
+    except Exception as e:
+        print(f"❌ ERROR: {str(e)}")
+        return False
+
 if __name__ == "__main__":
     print("\n🚀 Starting API Tests...")
     
+    if not test_retry_sleep_functions():
+        exit(1)
+    
     # Test health
     if not test_health():
         print("\n❌ Health check failed! Server might not be running.")
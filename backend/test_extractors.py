@@ -0,0 +1,36 @@
+"""
+Offline checks for the extractors (no network)
+
+    python -m pytest test_extractors.py
+"""
+
+import asyncio
+import pytest
+from deadline import Deadline, DeadlineExceeded
+from extractors import PreviewExtractor, YtDlpExtractor, ExtractionError, classify_error
+
+# yt-dlp rejects this before any request: "Incomplete YouTube ID abc ... looks truncated"
+TRUNCATED_URL = "https://www.youtube.com/watch?v=abc"
+
+
+def test_ytdlp_failure_keeps_message_not_traceback():
+    # config.YT_DLP_OPTIONS has verbose on, so yt-dlp logs a traceback after the message
+    with pytest.raises(ExtractionError) as raised:
+        asyncio.run(YtDlpExtractor().extract(TRUNCATED_URL))
+    message = str(raised.value)
+    assert "Incomplete YouTube ID" in message
+    assert 'File "' not in message
+    assert classify_error(message) == 'unsupported'
+
+
+def test_preview_failure_is_classified():
+    with pytest.raises(ExtractionError) as raised:
+        asyncio.run(PreviewExtractor().extract(TRUNCATED_URL))
+    assert raised.value.kind == 'unsupported'
+
+
+def test_preview_runs_under_the_deadline():
+    deadline = Deadline(1)
+    deadline.cancel()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(PreviewExtractor().extract(TRUNCATED_URL, deadline))
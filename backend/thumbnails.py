@@ -0,0 +1,224 @@
+"""
+Thumbnail proxy - fetch, downscale and cache preview images
+Clients get a small image from us instead of the full-resolution original
+from a slow third-party host
+"""
+
+import asyncio
+import hashlib
+import hmac
+import io
+import os
+import secrets
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+from cachetools import LRUCache
+import config
+from http_client import get_client
+
+
+def _load_signing_key() -> bytes:
+    """
+    THUMB_SIGNING_KEY, else the key in THUMB_SIGNING_KEY_FILE (created on
+    first use). Signed URLs are cached by clients for hours, so the key must
+    not change with a restart or differ between workers.
+    """
+    if config.THUMB_SIGNING_KEY:
+        return config.THUMB_SIGNING_KEY.encode()
+
+    path = config.THUMB_SIGNING_KEY_FILE
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(secrets.token_hex(32))
+            os.chmod(tmp_path, 0o600)
+            try:
+                os.link(tmp_path, path)  # fails if another worker got there first; theirs wins
+                print(f"✓ Generated thumbnail signing key in {path} (set THUMB_SIGNING_KEY to pin it)")
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+        except OSError as e:
+            raise RuntimeError(f"Cannot create {path} ({e}); set THUMB_SIGNING_KEY") from e
+
+    with open(path) as f:
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f"{path} is empty; delete it or set THUMB_SIGNING_KEY")
+    return key.encode()
+
+
+# Signing key for proxied URLs, so /api/thumb cannot be used as an open proxy
+_SIGNING_KEY = _load_signing_key()
+
+
+def sign(src: str) -> str:
+    return hmac.new(_SIGNING_KEY, src.encode(), hashlib.sha256).hexdigest()[:20]
+
+
+def verify(src: str, signature: str) -> bool:
+    return hmac.compare_digest(sign(src), signature or "")
+
+
+def snap_width(width: Optional[int]) -> int:
+    """Round a requested width up to one of the supported sizes"""
+    if not width:
+        return config.THUMB_DEFAULT_WIDTH
+    for allowed in config.THUMB_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return config.THUMB_WIDTHS[-1]
+
+
+def thumb_url(base_url: str, src: str, width: int = config.THUMB_DEFAULT_WIDTH) -> str:
+    query = urlencode({"src": src, "w": width, "sig": sign(src)})
+    return f"{base_url}/api/thumb?{query}"
+
+
+def with_thumbnail_proxy(data: Dict, base_url: str) -> Dict:
+    """Copy of an extraction result whose thumbnail points at /api/thumb"""
+    src = data.get("thumbnail")
+    if not src or not src.startswith(("http://", "https://")):
+        return data
+    return {**data, "thumbnail": thumb_url(base_url, src)}
+
+
+def _resize(content: bytes, content_type: str, width: int) -> Tuple[bytes, str]:
+    """Downscale to width as JPEG (blocking; runs in a worker thread)"""
+    try:
+        from PIL import Image
+    except ImportError:
+        # Pillow is optional; without it the original image is served
+        return content, content_type
+
+    with Image.open(io.BytesIO(content)) as image:
+        if image.width <= width:
+            return content, content_type
+        height = max(1, round(image.height * width / image.width))
+        image = image.convert("RGB").resize((width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=config.THUMB_JPEG_QUALITY, optimize=True, progressive=True)
+        return out.getvalue(), "image/jpeg"
+
+
+class ThumbnailCache:
+    """
+    Resized thumbnails in two tiers
+
+    Memory: LRU bounded by total bytes. Disk: one file per (source, width),
+    pruned oldest-first when the directory grows over its byte budget.
+    Entries are (content, content_type, etag).
+    """
+
+    def __init__(self):
+        self.memory = LRUCache(maxsize=config.THUMB_MEMORY_BYTES, getsizeof=lambda entry: len(entry[0]))
+        self.directory = config.THUMB_CACHE_DIR
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._writes = 0
+
+    @staticmethod
+    def key(src: str, width: int) -> str:
+        return hashlib.sha1(f"{width}:{src}".encode()).hexdigest()
+
+    async def get(self, src: str, width: int) -> Tuple[bytes, str, str]:
+        key = self.key(src, width)
+        entry = self.memory.get(key)
+        if entry:
+            return entry
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, src, width))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, src: str, width: int) -> Tuple[bytes, str, str]:
+        entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is None:
+            content, content_type = await self._fetch(src)
+            content, content_type = await asyncio.to_thread(_resize, content, content_type, width)
+            entry = (content, content_type, hashlib.md5(content).hexdigest())
+            await asyncio.to_thread(self._write_disk, key, entry)
+
+        if len(entry[0]) <= self.memory.maxsize:
+            self.memory[key] = entry
+        return entry
+
+    async def _fetch(self, src: str) -> Tuple[bytes, str]:
+        """Download the upstream image on the pooled client, with a size limit"""
+        async with get_client().stream("GET", src, timeout=config.THUMB_FETCH_TIMEOUT) as response:
+            if response.status_code != 200:
+                raise ValueError(f"Upstream returned {response.status_code}")
+            content_type = response.headers.get("content-type", "").split(";")[0]
+            if not content_type.startswith("image/"):
+                raise ValueError("Upstream is not an image")
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > config.THUMB_MAX_SOURCE_BYTES:
+                    raise ValueError("Upstream image too large")
+                chunks.append(chunk)
+        return b"".join(chunks), content_type
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _read_disk(self, key: str) -> Optional[Tuple[bytes, str, str]]:
+        try:
+            with open(self._path(key), "rb") as f:
+                header, content = f.read().split(b"\n", 1)
+            # A truncated or foreign file reads as a miss (UnicodeDecodeError is a ValueError)
+            content_type, etag = header.decode().split(" ", 1)
+            os.utime(self._path(key))  # mark as recently used for pruning
+        except (OSError, ValueError):
+            return None
+        return content, content_type, etag
+
+    def _write_disk(self, key: str, entry: Tuple[bytes, str, str]):
+        content, content_type, etag = entry
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self._path(key)}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(f"{content_type} {etag}\n".encode())
+                f.write(content)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Thumbnail disk cache write failed: {e}")
+            return
+
+        self._writes += 1
+        if self._writes % config.THUMB_DISK_PRUNE_EVERY == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Delete least recently used files until the directory fits its budget"""
+        files = []
+        total = 0
+        for name in os.listdir(self.directory):
+            try:
+                stat = os.stat(self._path(name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        for _mtime, size, name in sorted(files):
+            if total <= config.THUMB_DISK_MAX_BYTES:
+                break
+            try:
+                os.remove(self._path(name))
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "memory_items": len(self.memory),
+            "memory_bytes": self.memory.currsize,
+            "memory_budget": self.memory.maxsize,
+        }
@@ -0,0 +1,115 @@
+"""
+URL helpers - canonical form of a video URL
+Used as the key for caching and popularity tracking so that share links,
+mobile links and tracking parameters all map to the same entry
+"""
+
+import calendar
+import hashlib
+import time
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that never change which video a URL points at
+TRACKING_PARAMS = {
+    'si', 'feature', 'pp', 'fbclid', 'gclid', 'igshid', 'igsh',
+    'is_from_webapp', 'sender_device', 'share_id', 'ref', 'ref_src', 's', 't'
+}
+
+
+def youtube_video_id(url: str) -> Optional[str]:
+    """Extract the video ID from any YouTube URL shape"""
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if host == 'youtu.be':
+        return parts.path.lstrip('/').split('/')[0] or None
+    if host.endswith('youtube.com'):
+        query = dict(parse_qsl(parts.query))
+        if query.get('v'):
+            return query['v']
+        segments = [s for s in parts.path.split('/') if s]
+        if len(segments) >= 2 and segments[0] in ('shorts', 'embed', 'live', 'v'):
+            return segments[1]
+    return None
+
+
+def is_playlist_url(url: str) -> bool:
+    """True for playlist and channel URLs that should go through /api/playlist"""
+    if youtube_video_id(url):
+        return False
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if not host.endswith('youtube.com'):
+        return False
+    segments = [s for s in parts.path.split('/') if s]
+    if not segments:
+        return False
+    return (
+        segments[0] in ('playlist', 'channel', 'c', 'user')
+        or segments[0].startswith('@')
+    )
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a video URL
+
+    - lowercases scheme and host, drops "www." and "m." prefixes
+    - rewrites every YouTube video URL to https://www.youtube.com/watch?v=ID
+    - removes tracking parameters and fragments
+    """
+    url = url.strip()
+    video_id = youtube_video_id(url)
+    if video_id:
+        return f"https://www.youtube.com/watch?v={video_id}"
+
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if parts.port:
+        host = f"{host}:{parts.port}"
+
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS and not k.startswith('utm_')
+    ]
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+
+def cache_key(url: str) -> str:
+    """Short stable key for a canonical URL"""
+    return hashlib.md5(url.encode()).hexdigest()
+
+
+def url_expiry(url: str) -> Optional[float]:
+    """
+    Unix time at which a signed media URL stops working, if it says so
+
+    Understands googlevideo "expire", Cobalt tunnel "exp" (milliseconds),
+    Facebook/Instagram CDN "oe" (hex), TikTok "x-expires", CloudFront
+    "Expires" and S3 v4 "X-Amz-Date" + "X-Amz-Expires".
+    """
+    if not url:
+        return None
+    query = dict(parse_qsl(urlsplit(url).query))
+
+    try:
+        for name in ('expire', 'x-expires', 'Expires'):
+            if query.get(name):
+                return float(query[name])
+        if query.get('exp'):
+            exp = float(query['exp'])
+            return exp / 1000 if exp > 1e11 else exp
+        if query.get('oe'):
+            return float(int(query['oe'], 16))
+        if query.get('X-Amz-Date') and query.get('X-Amz-Expires'):
+            signed = calendar.timegm(time.strptime(query['X-Amz-Date'], '%Y%m%dT%H%M%SZ'))
+            return signed + float(query['X-Amz-Expires'])
+    except ValueError:
+        return None
+
+    return None
@@ -0,0 +1,191 @@
+"""
+Cache Warm-up - popularity tracking and background prefetch
+Keeps the most requested videos extracted across deploys and restarts
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from array import array
+from typing import Awaitable, Callable, Dict, List, Optional
+import config
+
+
+class CountMinSketch:
+    """
+    Compact approximate frequency counter
+
+    Counts never underestimate; collisions can only inflate them.
+    decay() scales every counter so old popularity fades out.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('f', [0.0]) * width for _ in range(depth)]
+
+    def _indexes(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=8 * self.depth).digest()
+        for row in range(self.depth):
+            chunk = digest[row * 8:(row + 1) * 8]
+            yield row, int.from_bytes(chunk, 'little') % self.width
+
+    def add(self, key: str, count: float = 1.0) -> float:
+        """Add to a key's count and return its new estimate"""
+        estimate = None
+        for row, idx in self._indexes(key):
+            self.rows[row][idx] += count
+            value = self.rows[row][idx]
+            estimate = value if estimate is None else min(estimate, value)
+        return estimate
+
+    def estimate(self, key: str) -> float:
+        return min(self.rows[row][idx] for row, idx in self._indexes(key))
+
+    def decay(self, factor: float):
+        for counters in self.rows:
+            for idx in range(self.width):
+                counters[idx] *= factor
+
+
+class PopularityTracker:
+    """Tracks request frequency per canonical URL and keeps the top-K"""
+
+    def __init__(self, top_k: int = config.WARMUP_TOP_K):
+        self.top_k = top_k
+        self.sketch = CountMinSketch(config.WARMUP_SKETCH_WIDTH, config.WARMUP_SKETCH_DEPTH)
+        self.top: Dict[str, float] = {}
+
+    def record(self, url: str) -> float:
+        """Count one request for url and return its popularity estimate"""
+        score = self.sketch.add(url)
+
+        if url in self.top or len(self.top) < self.top_k:
+            self.top[url] = score
+        else:
+            coldest = min(self.top, key=self.top.get)
+            if score > self.top[coldest]:
+                del self.top[coldest]
+                self.top[url] = score
+
+        return score
+
+    def score(self, url: str) -> float:
+        return self.sketch.estimate(url)
+
+    def decay(self, factor: float = config.WARMUP_DECAY):
+        self.sketch.decay(factor)
+        for url in self.top:
+            self.top[url] *= factor
+
+    def hottest(self, limit: Optional[int] = None) -> List[str]:
+        ranked = sorted(self.top, key=self.top.get, reverse=True)
+        return ranked[:limit] if limit else ranked
+
+    def save(self, path: str = config.WARMUP_STATE_FILE):
+        """Persist the top-K list (written atomically)"""
+        state = {
+            "version": 1,
+            "saved_at": time.time(),
+            "top": [{"url": url, "score": self.top[url]} for url in self.hottest()]
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str = config.WARMUP_STATE_FILE):
+        """Restore a persisted top-K list, seeding the sketch with its scores"""
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        for item in state.get("top", [])[:self.top_k]:
+            url, score = item.get("url"), item.get("score", 1.0)
+            if url:
+                self.sketch.add(url, score)
+                self.top[url] = self.sketch.estimate(url)
+
+
+class CacheWarmer:
+    """
+    Background prefetch of popular URLs
+
+    Runs once at startup and then every WARMUP_INTERVAL seconds.
+    Warm-up extractions have their own small concurrency budget and only
+    start while no live extraction is in flight, so they never compete
+    with real users for upstream capacity.
+    """
+
+    def __init__(
+        self,
+        tracker: PopularityTracker,
+        fetch: Callable[[str], Awaitable],
+        is_cached: Callable[[str], bool],
+        live_count: Callable[[], int],
+    ):
+        self.tracker = tracker
+        self.fetch = fetch
+        self.is_cached = is_cached
+        self.live_count = live_count
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"warmed": 0, "failed": 0, "last_run": None}
+
+    def start(self):
+        self.tracker.load()
+        self.semaphore = asyncio.Semaphore(config.WARMUP_CONCURRENCY)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._save()
+
+    def _save(self):
+        try:
+            self.tracker.save()
+        except OSError as e:
+            print(f"Warm-up state could not be saved: {e}")
+
+    async def _run(self):
+        await asyncio.sleep(config.WARMUP_STARTUP_DELAY)
+        while True:
+            await self.warm()
+            await asyncio.sleep(config.WARMUP_INTERVAL)
+            self.tracker.decay()
+            self._save()
+
+    async def _wait_for_idle(self):
+        while self.live_count() > 0:
+            await asyncio.sleep(config.WARMUP_IDLE_POLL)
+
+    async def _warm_one(self, url: str):
+        async with self.semaphore:
+            await self._wait_for_idle()
+            if self.is_cached(url):
+                return
+            try:
+                await self.fetch(url)
+                self.stats["warmed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"Warm-up failed for {url}: {e}")
+
+    async def warm(self):
+        """Pre-extract every tracked URL that is not cached or is due for a refresh"""
+        pending = [url for url in self.tracker.hottest() if not self.is_cached(url)]
+        self.stats["last_run"] = time.time()
+        if not pending:
+            return
+
+        print(f"Warm-up: prefetching {len(pending)} popular URLs")
+        await asyncio.gather(*(self._warm_one(url) for url in pending))
@@ -6,25 +6,54 @@ function App() {
   const [loading, setLoading] = useState(false)
   const [videoData, setVideoData] = useState(null)
   const [error, setError] = useState('')
+  const [submittedUrl, setSubmittedUrl] = useState('')
+  const [resolving, setResolving] = useState(false)
+
+  // Use environment variable for API URL or fallback to localhost
+  const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+
+  // Full extraction (formats); only once the user asks for the download links
+  const resolveFormats = async (target) => {
+    setResolving(true)
+    setError('')
+    try {
+      const response = await axios.post(`${API_URL}/api/download`, { url: target })
+      setVideoData(response.data)
+    } catch (err) {
+      console.error(err)
+      const msg = err.response?.data?.detail || err.message || 'Failed to fetch';
+      setError(msg)
+    } finally {
+      setResolving(false)
+    }
+  }
 
   const handleDownload = async () => {
     if (!url) return
     setLoading(true)
     setError('')
     setVideoData(null)
+    setSubmittedUrl(url)
 
+    let noPreview = false
     try {
-      // Use environment variable for API URL or fallback to localhost
-      const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
-      const response = await axios.post(`${API_URL}/api/download`, { url })
+      // The preview is cheap (no formats); it comes back complete when the full result is cached
+      const response = await axios.post(`${API_URL}/api/preview`, { url })
       setVideoData(response.data)
     } catch (err) {
-      console.error(err)
-      const msg = err.response?.data?.detail || err.message || 'Failed to fetch';
-      setError(msg)
+      // 404: this link has no preview; anything else is worth showing
+      noPreview = err.response?.status === 404
+      if (!noPreview) {
+        console.error(err)
+        const msg = err.response?.data?.detail || err.message || 'Failed to load preview';
+        setError(msg)
+      }
     } finally {
       setLoading(false)
     }
+
+    // No preview for this link: go straight to the full extraction
+    if (noPreview) await resolveFormats(url)
   }
 
   return (
@@ -72,10 +101,10 @@ function App() {
             {/* Download Button */}
             <button
               onClick={handleDownload}
-              disabled={loading}
+              disabled={loading || resolving}
               className="bg-gradient-to-r from-sherov-neon to-sherov-purple text-black font-bold px-4 md:px-6 py-2.5 md:py-3 rounded-lg hover:opacity-90 transition-opacity disabled:opacity-50 flex items-center justify-center min-w-[80px] md:min-w-[100px] text-sm md:text-base whitespace-nowrap"
             >
-              {loading ? (
+              {loading || resolving ? (
                 <svg className="animate-spin h-5 w-5" viewBox="0 0 24 24">
                   <circle className="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="4"></circle>
                   <path className="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z"></path>
@@ -148,6 +177,15 @@ function App() {
                         </svg>
                       </a>
                     ))
+                  ) : videoData.formats_pending && resolving ? (
+                    <p className="text-gray-400 text-sm animate-pulse">Resolving formats...</p>
+                  ) : videoData.formats_pending ? (
+                    <button
+                      onClick={() => resolveFormats(submittedUrl)}
+                      className="w-full bg-white/10 hover:bg-white/20 text-white border border-white/20 py-3 rounded-lg text-center font-medium transition-all"
+                    >
+                      Get download links
+                    </button>
                   ) : (
                     <p className="text-gray-400 text-sm">No specific formats found. Try the direct link below.</p>
                   )}
@@ -163,6 +201,16 @@ function App() {
                       Download Video
                     </a>
                   )}
+
+                  {/* Carousels and multi-media posts: every item in one archive */}
+                  {videoData.picker && videoData.picker.length > 1 && (
+                    <a
+                      href={`${API_URL}/api/zip?url=${encodeURIComponent(submittedUrl)}`}
+                      className="bg-sherov-neon/20 hover:bg-sherov-neon/30 text-sherov-neon border border-sherov-neon/50 py-3 rounded-lg text-center font-medium transition-all block"
+                    >
+                      Download all {videoData.picker.length} items (ZIP)
+                    </a>
+                  )}
                 </div>
               </div>
             </div>
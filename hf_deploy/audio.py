@@ -0,0 +1,173 @@
+"""
+Audio pipeline - best audio format -> ffmpeg pipe -> client
+Transcodes to the requested codec/bitrate (or stream-copies AAC to m4a),
+bounds concurrent transcodes to the CPU count and keeps finished files
+on disk keyed by video and bitrate
+"""
+
+import asyncio
+import os
+from typing import AsyncIterator, Dict, List, Optional
+import config
+
+_transcode_slots: Optional[asyncio.Semaphore] = None
+
+
+def _slots() -> asyncio.Semaphore:
+    # Created on first use so it binds to the server's event loop
+    global _transcode_slots
+    if _transcode_slots is None:
+        _transcode_slots = asyncio.Semaphore(config.AUDIO_TRANSCODE_CONCURRENCY)
+    return _transcode_slots
+
+
+def snap_bitrate(bitrate: Optional[int]) -> int:
+    """Closest supported bitrate (kbps)"""
+    if not bitrate:
+        return config.AUDIO_DEFAULT_BITRATE
+    return min(config.AUDIO_BITRATES, key=lambda allowed: abs(allowed - bitrate))
+
+
+def best_audio_format(info: Dict, codec: Optional[str] = None) -> Optional[Dict]:
+    """
+    Highest-bitrate audio-only format from a yt-dlp info dict (direct HTTP
+    preferred; for m4a an AAC source, which needs no transcode)
+    """
+    candidates = [
+        f for f in info.get('formats') or []
+        if f.get('url') and f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda f: (
+        f.get('protocol') in ('http', 'https'),
+        codec == 'm4a' and (f.get('acodec') or '').startswith('mp4a'),
+        f.get('abr') or f.get('tbr') or 0
+    ))
+
+
+def can_stream_copy(fmt: Dict, codec: str, bitrate: Optional[int]) -> bool:
+    """AAC source into m4a needs no transcode unless a lower bitrate was asked for"""
+    if codec != 'm4a' or not (fmt.get('acodec') or '').startswith('mp4a'):
+        return False
+    source_kbps = fmt.get('abr') or fmt.get('tbr') or 0
+    return not bitrate or not source_kbps or bitrate >= source_kbps
+
+
+def cache_path(media_key: str, codec: str, bitrate: Optional[int]) -> str:
+    ext = config.AUDIO_CODECS[codec][2]
+    return os.path.join(config.AUDIO_CACHE_DIR, f"{media_key}-{bitrate or 'src'}k.{ext}")
+
+
+def cached_file(media_key: str, codec: str, bitrate: Optional[int]) -> Optional[str]:
+    path = cache_path(media_key, codec, bitrate)
+    return path if os.path.exists(path) else None
+
+
+def ffmpeg_input(fmt: Dict) -> List[str]:
+    """ffmpeg arguments reading a format's URL (with its headers, reconnecting)"""
+    headers = "".join(f"{k}: {v}\r\n" for k, v in (fmt.get('http_headers') or {}).items())
+    args = ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5"]
+    if headers:
+        args += ["-headers", headers]
+    return args + ["-i", fmt['url']]
+
+
+def build_command(fmt: Dict, codec: str, bitrate: Optional[int], copy: bool) -> List[str]:
+    encoder, muxer, _, _ = config.AUDIO_CODECS[codec]
+
+    cmd = [config.FFMPEG_PATH, "-hide_banner", "-loglevel", "error", "-nostdin"]
+    cmd += ffmpeg_input(fmt) + ["-vn", "-map_metadata", "-1"]
+
+    if copy:
+        cmd += ["-c:a", "copy"]
+    else:
+        cmd += ["-c:a", encoder, "-b:a", f"{snap_bitrate(bitrate)}k"]
+
+    if muxer == "mp4":
+        # Fragmented MP4 can be written to a pipe (no seeking back for the moov atom)
+        cmd += ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+    cmd += ["-f", muxer, "pipe:1"]
+    return cmd
+
+
+def _prune_cache():
+    """Delete least recently used files until the cache fits its byte budget"""
+    files = []
+    total = 0
+    for name in os.listdir(config.AUDIO_CACHE_DIR):
+        if name.endswith(".part"):
+            continue  # a transcode still being written; not part of the cache yet
+        path = os.path.join(config.AUDIO_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((stat.st_atime, stat.st_size, path))
+        total += stat.st_size
+
+    for _atime, size, path in sorted(files):
+        if total <= config.AUDIO_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+async def stream_audio(media_key: str, fmt: Dict, codec: str, bitrate: Optional[int]) -> AsyncIterator[bytes]:
+    """
+    Yield encoded audio as ffmpeg produces it, teeing it into the file cache
+
+    The cache file only appears once ffmpeg exits cleanly, so an aborted
+    download never leaves a truncated file behind.
+    """
+    copy = can_stream_copy(fmt, codec, bitrate)
+    # Transcodes need a bitrate; m4a without one keeps the source bitrate only by copying
+    bitrate = None if copy else snap_bitrate(bitrate)
+    path = cache_path(media_key, codec, bitrate)
+    os.makedirs(config.AUDIO_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{id(fmt)}.part"
+
+    # Stream copies cost no CPU, so only transcodes take a slot
+    slot = None if copy else _slots()
+    if slot:
+        await slot.acquire()
+
+    completed = False
+    proc = None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *build_command(fmt, codec, bitrate, copy),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = await proc.stdout.read(config.AUDIO_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+                yield chunk
+
+        returncode = await proc.wait()
+        completed = returncode == 0
+        if not completed:
+            error = (await proc.stderr.read()).decode(errors="replace").strip()
+            print(f"ffmpeg exited with {returncode}: {error[-500:]}")
+    finally:
+        if proc and proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if slot:
+            slot.release()
+
+        if completed:
+            os.replace(tmp_path, path)
+            _prune_cache()
+        else:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
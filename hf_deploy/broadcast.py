@@ -0,0 +1,392 @@
+"""
+Broadcast - one upstream fetch per unique stream, shared by every client
+The first request for a key starts the upstream source. While it has one
+reader the bytes only pass through memory (the first BROADCAST_JOIN_WINDOW
+are kept so another client can still join from the start); when a second
+reader joins, the stream moves to a spill file used as a ring of
+BROADCAST_SPILL_CAP bytes, which every client reads from its own offset.
+The upstream only waits for the slowest reader once that reader is a
+whole window (memory) or ring (spill file) behind. File I/O runs in
+worker threads
+"""
+
+import asyncio
+import glob
+import hashlib
+import itertools
+import os
+import time
+import weakref
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple
+import config
+
+# What opening a stream yields: (chunks, media type, response headers)
+Opened = Tuple[AsyncIterator[bytes], str, Dict[str, str]]
+
+
+def _owner_alive(path: str) -> bool:
+    """Whether the process named in a spill file's name ("<digest>-<pid>-<n>.spill") still runs"""
+    try:
+        pid = int(os.path.basename(path).split("-")[1])
+    except (IndexError, ValueError):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+def _ring_write(fd: int, cap: int, position: int, data: bytes):
+    """Write data at stream position into a ring file of cap bytes"""
+    start = position % cap
+    head = data[:cap - start]
+    os.pwrite(fd, head, start)
+    if len(head) < len(data):
+        os.pwrite(fd, data[len(head):], 0)
+
+
+def _discard_spill(fd: int, path: str):
+    os.close(fd)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Broadcast:
+    """One upstream source and the readers sharing it"""
+
+    def __init__(self, hub: "BroadcastHub", key: str, opened: Opened):
+        source, self.media_type, self.headers = opened
+        self.hub = hub
+        self.key = key
+        self.size = 0  # bytes received from upstream
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.joined = 0
+        self.started = time.monotonic()
+        self.idle_since: Optional[float] = None
+        self.path: Optional[str] = None  # spill file, once a second reader joined
+        self._fd: Optional[int] = None
+        self._end = 0  # size plus the chunk being written to the spill file
+        self._memory = bytearray()  # bytes [_memory_start, size) while not spilled
+        self._memory_start = 0
+        self._offsets: Dict[object, int] = {}  # next byte of each reader
+        self._changed = asyncio.Event()
+        self._io = asyncio.Lock()  # spill writes and the move to disk, one at a time
+        self._pending_io: Set[asyncio.Future] = set()
+        self._pump_task = asyncio.create_task(self._pump(source))
+
+    @property
+    def readers(self) -> int:
+        return len(self._offsets)
+
+    @property
+    def spilled(self) -> bool:
+        return self._fd is not None
+
+    @property
+    def joinable(self) -> bool:
+        """Whether a new reader can still start from the first byte"""
+        if self.error:
+            return False
+        if self.spilled:
+            return self._end <= self.hub.spill_cap
+        return self.size <= self.hub.join_window
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _wait_for(self, predicate: Callable[[], bool]):
+        while not predicate():
+            await self._changed.wait()
+
+    async def _in_thread(self, fn, *args):
+        """Blocking file I/O in a worker thread; close() waits for any still running"""
+        future = asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        self._pending_io.add(future)
+        future.add_done_callback(self._pending_io.discard)
+        # Shielded: a cancelled reader or pump must not leave a thread using a closed fd
+        return await asyncio.shield(future)
+
+    def _slowest(self) -> int:
+        return min(self._offsets.values(), default=self.size)
+
+    def _has_room(self, length: int) -> bool:
+        if self.spilled:
+            # Never overwrite what the slowest reader has not read yet
+            return self._end + length - self._slowest() <= self.hub.spill_cap
+        return self.joinable or self.size - self._slowest() <= self.hub.join_window
+
+    def _trim(self):
+        """Drop memory no reader needs any more (none while the stream is joinable)"""
+        if self.spilled or self.joinable:
+            return
+        keep_from = self._slowest()
+        if keep_from > self._memory_start:
+            del self._memory[:keep_from - self._memory_start]
+            self._memory_start = keep_from
+
+    async def _pump(self, source: AsyncIterator[bytes]):
+        try:
+            async for chunk in source:
+                while True:
+                    await self._wait_for(lambda: self._has_room(len(chunk)))
+                    async with self._io:
+                        if not self._has_room(len(chunk)):
+                            continue  # a reader joined meanwhile
+                        await self._append(chunk)
+                        break
+                self._notify()
+        except Exception as e:
+            print(f"✗ Broadcast {self.key} upstream failed after {self.size} bytes: {str(e)}")
+            self.error = e
+        finally:
+            self.done = True
+            await source.aclose()
+            self._notify()
+            self.hub._finished(self)
+
+    async def _append(self, chunk: bytes):
+        if not self.spilled:
+            self._memory += chunk
+            self.size += len(chunk)
+            self._end = self.size
+            self._trim()
+            return
+        self._end = self.size + len(chunk)
+        await self._in_thread(_ring_write, self._fd, self.hub.spill_cap, self.size, chunk)
+        self.size = self._end
+
+    async def _spill(self):
+        """Move the stream to a spill file so readers may fall further apart"""
+        async with self._io:
+            if self.spilled:
+                return
+            fd = None
+            try:
+                path = await self._in_thread(self.hub._spill_path, self.key)
+                fd = await self._in_thread(os.open, path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+                data = bytes(self._memory)  # the whole stream so far: it is still joinable
+                await self._in_thread(os.pwrite, fd, data, 0)
+            except OSError as e:
+                if fd is not None:
+                    await self._in_thread(_discard_spill, fd, path)
+                # Readers share the memory window instead
+                print(f"✗ Broadcast {self.key} could not spill to disk: {str(e)}")
+                self.hub.spilling.discard(self)
+                return
+            self.path, self._fd = path, fd
+            self._end = self.size
+            self._memory = bytearray()
+
+    async def join(self) -> Optional[AsyncIterator[bytes]]:
+        """A new reader from the first byte; None when sharing would go over the disk budget"""
+        if self.readers and not self.done and not self.spilled:
+            if not self.hub._reserve_spill(self):
+                return None
+            reader = self._attach()  # registered first, so nothing it needs is dropped meanwhile
+            await self._spill()
+            return reader
+        return self._attach()
+
+    def _attach(self) -> AsyncIterator[bytes]:
+        token = object()
+        self._offsets[token] = 0
+        self.joined += 1
+        self.idle_since = None
+        reader = self._read(token)
+        # A response that never starts iterating still gives its place up
+        weakref.finalize(reader, self._leave, token)
+        return reader
+
+    async def _read(self, token: object) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                offset = self._offsets[token]
+                if offset < self.size:
+                    chunk = await self._read_at(offset, min(self.size - offset, config.STREAM_CHUNK_SIZE))
+                    self._offsets[token] = offset + len(chunk)
+                    self._trim()
+                    self._notify()  # the pump may be waiting for room
+                    yield chunk
+                    continue
+                if self.done:
+                    if self.error:
+                        raise self.error
+                    return
+                await self._wait_for(lambda: self.size > offset or self.done)
+        finally:
+            self._leave(token)
+
+    async def _read_at(self, offset: int, length: int) -> bytes:
+        if not self.spilled:
+            start = offset - self._memory_start
+            return bytes(self._memory[start:start + length])
+        cap = self.hub.spill_cap
+        position = offset % cap
+        return await self._in_thread(os.pread, self._fd, min(length, cap - position), position)
+
+    def _leave(self, token: object):
+        if self._offsets.pop(token, None) is None:
+            return
+        self._trim()
+        try:
+            self._notify()
+            if not self._offsets:
+                self.hub._idle(self)
+        except RuntimeError:
+            pass  # collected after the event loop closed
+
+    async def close(self):
+        """Stop the upstream and free the memory and spill file"""
+        self._pump_task.cancel()
+        await asyncio.gather(self._pump_task, return_exceptions=True)
+        if self._pending_io:
+            await asyncio.wait(set(self._pending_io))
+        self._memory = bytearray()
+        if self.spilled:
+            fd, self._fd = self._fd, None
+            await asyncio.get_running_loop().run_in_executor(None, _discard_spill, fd, self.path)
+        self.hub.spilling.discard(self)
+
+
+class BroadcastHub:
+    """
+    Live broadcasts by key ("video:<media key>:<quality>", ...)
+
+    Concurrent first requests for a key share one open_source call; a later
+    request joins while the broadcast still holds its first byte. A
+    broadcast stays joinable for BROADCAST_LINGER seconds after its last
+    reader leaves; one whose readers all left before it finished is
+    cancelled then. Each spill file takes up to BROADCAST_SPILL_CAP bytes;
+    a join that would take the spill files past BROADCAST_DISK_BUDGET is
+    streamed to its client directly, unshared.
+    """
+
+    def __init__(self, directory: str = config.BROADCAST_DIR,
+                 disk_budget: int = config.BROADCAST_DISK_BUDGET,
+                 linger: float = config.BROADCAST_LINGER,
+                 join_window: int = config.BROADCAST_JOIN_WINDOW,
+                 spill_cap: int = config.BROADCAST_SPILL_CAP):
+        self.directory = directory
+        self.disk_budget = disk_budget
+        self.linger = linger
+        self.join_window = join_window
+        self.spill_cap = spill_cap
+        self.live: Dict[str, Broadcast] = {}
+        self.spilling: Set[Broadcast] = set()  # broadcasts holding (or creating) a spill file
+        self.unshared = 0
+        self._opening: Dict[str, asyncio.Task] = {}
+        self._closing: Set[asyncio.Task] = set()
+        self._ids = itertools.count(1)
+        self._prepared = False
+
+    def _prepare(self):
+        # Spill files of processes that are gone are never read again; other
+        # live workers' files (same directory) are left alone
+        os.makedirs(self.directory, exist_ok=True)
+        for path in glob.glob(os.path.join(self.directory, "*.spill")):
+            if _owner_alive(path):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._prepared = True
+
+    def _spill_path(self, key: str) -> str:
+        """Path for a new spill file (blocking: prepares the directory on first use)"""
+        if not self._prepared:
+            self._prepare()
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{digest}-{os.getpid()}-{next(self._ids)}.spill")
+
+    def _reserve_spill(self, broadcast: Broadcast) -> bool:
+        if broadcast not in self.spilling:
+            if (len(self.spilling) + 1) * self.spill_cap > self.disk_budget:
+                return False
+            self.spilling.add(broadcast)
+        return True
+
+    def spilled(self) -> int:
+        return sum(min(b.size, self.spill_cap) for b in self.spilling if b.spilled)
+
+    async def stream(self, key: str, open_source: Callable[[], Awaitable[Opened]]) -> Opened:
+        """A reader of the key's broadcast, starting it (open_source) when none is joinable"""
+        broadcast = self.live.get(key)
+        if broadcast is not None and not broadcast.joinable:
+            del self.live[key]  # too far along to join; it carries on for its own readers
+            broadcast = None
+
+        if broadcast is None:
+            opening = self._opening.get(key)
+            if opening is None:
+                opening = asyncio.create_task(self._start(key, open_source))
+                self._opening[key] = opening
+            broadcast = await asyncio.shield(opening)
+        else:
+            print(f"⇉ Joining broadcast {key} at {broadcast.size} bytes ({broadcast.readers} reading)")
+
+        reader = await broadcast.join()
+        if reader is None:
+            self.unshared += 1
+            return await open_source()
+        return reader, broadcast.media_type, broadcast.headers
+
+    async def _start(self, key: str, open_source: Callable[[], Awaitable[Opened]]) -> Broadcast:
+        try:
+            broadcast = Broadcast(self, key, await open_source())
+            self.live[key] = broadcast
+            return broadcast
+        finally:
+            self._opening.pop(key, None)
+
+    def _finished(self, broadcast: Broadcast):
+        if broadcast.error and self.live.get(broadcast.key) is broadcast:
+            del self.live[broadcast.key]  # the next request starts over
+        if broadcast.readers == 0:
+            self._idle(broadcast)
+
+    def _idle(self, broadcast: Broadcast):
+        broadcast.idle_since = time.monotonic()
+        asyncio.get_running_loop().call_later(self.linger, self._expire, broadcast)
+
+    def _expire(self, broadcast: Broadcast):
+        if broadcast.readers or broadcast.idle_since is None:
+            return
+        if time.monotonic() - broadcast.idle_since < self.linger - 0.01:
+            return  # a newer idle period has its own timer
+        if self.live.get(broadcast.key) is broadcast:
+            del self.live[broadcast.key]
+        broadcast.idle_since = None
+        task = asyncio.create_task(broadcast.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "live": len(self.live),
+            "spill_files": sum(1 for b in self.spilling if b.spilled),
+            "spilled_bytes": self.spilled(),
+            "disk_budget": self.disk_budget,
+            "unshared_streams": self.unshared,
+            "broadcasts": [
+                {
+                    "key": b.key,
+                    "bytes": b.size,
+                    "done": b.done,
+                    "spilled": b.spilled,
+                    "joinable": b.joinable,
+                    "readers": b.readers,
+                    "joined": b.joined,
+                    "age_seconds": round(now - b.started, 1),
+                }
+                for b in self.live.values()
+            ],
+        }
@@ -0,0 +1,95 @@
+"""
+Configuration for the Hugging Face Spaces backend
+Streaming, audio and extraction settings used by main.py
+"""
+
+import os
+
+# yt-dlp configuration (in-process extraction)
+YT_DLP_OPTIONS = {
+    'quiet': True,
+    'no_warnings': True,
+    'format': 'best',
+    'nocheckcertificate': True,
+    'ignoreerrors': True,
+    'no_color': True,
+    'socket_timeout': 30,
+    'force_ipv4': True,
+    'noplaylist': True,  # watch?v=...&list=... extracts just the video
+    'extract_flat': 'in_playlist',  # never resolve every entry of a playlist
+    'fragment_retries': 3,
+    'skip_unavailable_fragments': True,
+}
+
+# Shared HTTP connection pool (httpx)
+TIMEOUT = 30
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE = 32
+HTTP_KEEPALIVE_EXPIRY = 60
+
+# Connection pre-warming of the known upstreams (Invidious instances and Cobalt)
+PREWARM_ENABLED = os.environ.get("PREWARM_ENABLED", "1") != "0"
+PREWARM_MIN_IDLE = 2  # pooled connections kept open per host
+PREWARM_INTERVAL = 45  # seconds between keep-alive rounds (below HTTP_KEEPALIVE_EXPIRY)
+PREWARM_IDLE_STOP = 600  # keep-alive rounds pause after this long without upstream requests
+PREWARM_TIMEOUT = 5
+
+# Record/replay of upstream traffic for offline benchmarks (off, record, replay)
+CASSETTE_MODE = os.environ.get("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.environ.get("CASSETTE_PATH", "cassettes/default.json")
+CASSETTE_SPEED = float(os.environ.get("CASSETTE_SPEED", 1))  # replay timing: 1 = as recorded, 0 = no delays
+CASSETTE_ALLOW_YTDLP_MISMATCH = os.environ.get("CASSETTE_ALLOW_YTDLP_MISMATCH") == "1"  # replay across yt-dlp versions anyway
+
+# HLS/DASH fragment fetching in the stream path
+FRAGMENT_CONCURRENCY_PER_STREAM = 4  # fragments in flight for one stream
+FRAGMENT_CONCURRENCY_GLOBAL = 16  # fragments in flight across all streams
+FRAGMENT_TIMEOUT = 20
+FRAGMENT_RETRY_DELAY = 0.5  # seconds, doubled per retry
+
+# Size probing: HEAD / one-byte Range requests fill in missing file sizes
+SIZE_PROBE_BUDGET = 1.5  # seconds for all probes of one extraction
+SIZE_PROBE_MAX_FORMATS = 12
+
+# Stream governor (/api/stream): memory and egress shared by all streams
+GOVERNOR_MEMORY_BUDGET = 256 * 1024 * 1024  # bytes buffered across all streams
+GOVERNOR_STREAM_BUFFER = 16 * 1024 * 1024  # read-ahead of a single stream
+GOVERNOR_BANDWIDTH = int(os.environ.get("GOVERNOR_BANDWIDTH", 0))  # total bytes/s, 0 = unlimited
+GOVERNOR_WEIGHTS = {'audio': 2, 'video': 1}  # relative bandwidth share per stream type
+STREAM_CHUNK_SIZE = 64 * 1024  # reads from upstream and from subprocess pipes
+
+# Broadcast: identical concurrent streams share one upstream fetch (a spill file once shared)
+BROADCAST_DIR = "broadcast_spill"
+BROADCAST_JOIN_WINDOW = 8 * 1024 * 1024  # first bytes kept in memory so an unshared stream can still be joined
+BROADCAST_SPILL_CAP = 512 * 1024 * 1024  # ring size of one spill file: how far readers may drift apart
+BROADCAST_DISK_BUDGET = 2 * 1024 * 1024 * 1024  # all spill files (at their cap) before new joiners go unshared
+BROADCAST_LINGER = 30  # seconds a broadcast stays joinable after its last reader left
+
+# Direct streaming from the cached extraction (no yt-dlp subprocess)
+DIRECT_RANGE_SIZE = 10 * 1024 * 1024  # bytes per Range request, like yt-dlp's http_chunk_size
+
+# Optional cookies for YouTube
+COOKIE_PATH = '/home/user/app/cookies.txt'
+
+# Cached yt-dlp info dicts (format URLs are signed, keep this short)
+INFO_CACHE_TTL = 600
+INFO_CACHE_SIZE = 200
+
+# Cobalt
+COBALT_API_URL = "https://api.cobalt.tools/"
+COBALT_URL_TTL = 240  # Cobalt tunnel URLs die quickly
+
+# Audio pipeline (/api/stream?type=audio)
+FFMPEG_PATH = "ffmpeg"
+AUDIO_CODECS = {
+    # codec: (ffmpeg encoder, ffmpeg muxer, extension, media type)
+    'mp3': ('libmp3lame', 'mp3', 'mp3', 'audio/mpeg'),
+    'm4a': ('aac', 'mp4', 'm4a', 'audio/mp4'),
+    'opus': ('libopus', 'ogg', 'opus', 'audio/ogg'),
+}
+AUDIO_DEFAULT_CODEC = 'mp3'
+AUDIO_BITRATES = (96, 128, 160, 192, 256, 320)  # kbps
+AUDIO_DEFAULT_BITRATE = 192
+AUDIO_TRANSCODE_CONCURRENCY = os.cpu_count() or 1
+AUDIO_CACHE_DIR = "audio_cache"
+AUDIO_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+AUDIO_CHUNK_SIZE = 64 * 1024
@@ -0,0 +1,139 @@
+"""
+Direct streaming - /api/stream from the cached extraction, in-process
+Progressive formats are relayed through the pooled httpx client in
+Range-sized pieces; separate video and audio formats are muxed by ffmpeg
+(stream copy) into a pipe. No yt-dlp interpreter is started per download
+"""
+
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import config
+from audio import ffmpeg_input
+from http_client import get_client
+from sizes import CONTENT_RANGE_TOTAL
+
+DIRECT_PROTOCOLS = ('http', 'https')
+
+# ffmpeg muxer, extension and media type by the extensions being merged
+MUX_CONTAINERS = {
+    ('mp4', 'm4a'): ('mp4', 'mp4', 'video/mp4'),
+    ('mp4', 'mp4'): ('mp4', 'mp4', 'video/mp4'),
+    ('webm', 'webm'): ('webm', 'webm', 'video/webm'),
+}
+DEFAULT_CONTAINER = ('matroska', 'mkv', 'video/x-matroska')
+
+
+def is_direct(fmt: Dict) -> bool:
+    return bool(fmt.get('url')) and fmt.get('protocol') in DIRECT_PROTOCOLS
+
+
+def select_formats(info: Dict, quality: Optional[str]) -> Optional[List[Dict]]:
+    """
+    What "bestvideo[height<=Q]+bestaudio/best[height<=Q]" picks: [video,
+    audio] or [muxed]. yt-dlp lists formats worst to best, so the best of a
+    kind is the last one. None when the pick is not plain HTTP.
+    """
+    max_height = int(quality) if quality and quality.isdigit() else None
+    formats = info.get('formats') or []
+
+    def fits(f):
+        return max_height is None or (f.get('height') is not None and f['height'] <= max_height)
+
+    video = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') == 'none' and fits(f)]
+    audio = [f for f in formats if f.get('acodec') != 'none' and f.get('vcodec') == 'none']
+    muxed = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') != 'none' and fits(f)]
+
+    if video and audio:
+        chosen = [video[-1], audio[-1]]
+    elif muxed:
+        chosen = [muxed[-1]]
+    else:
+        return None
+    return chosen if all(is_direct(f) for f in chosen) else None
+
+
+def container(video: Dict, audio: Dict) -> Tuple[str, str, str]:
+    """(ffmpeg muxer, extension, media type) a stream copy of both fits in"""
+    return MUX_CONTAINERS.get((video.get('ext'), audio.get('ext')), DEFAULT_CONTAINER)
+
+
+def mux_command(video: Dict, audio: Dict) -> List[str]:
+    muxer = container(video, audio)[0]
+    cmd = [config.FFMPEG_PATH, "-hide_banner", "-loglevel", "error", "-nostdin"]
+    cmd += ffmpeg_input(video) + ffmpeg_input(audio)
+    cmd += ["-map", "0:v:0", "-map", "1:a:0", "-c", "copy"]
+    if muxer == "mp4":
+        # Fragmented MP4 can be written to a pipe (no seeking back for the moov atom)
+        cmd += ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+    return cmd + ["-f", muxer, "pipe:1"]
+
+
+async def relay(fmt: Dict) -> AsyncIterator[bytes]:
+    """
+    Yield a direct format's bytes from the pooled client
+
+    Asked for DIRECT_RANGE_SIZE bytes at a time, like yt-dlp's
+    http_chunk_size (YouTube throttles unranged downloads); a server that
+    ignores Range answers 200 with the whole file, relayed as it comes.
+    A dropped connection resumes where it stopped, fragment_retries times.
+    """
+    client = get_client()
+    headers = dict(fmt.get('http_headers') or {})
+    total = fmt.get('filesize')
+    position = 0
+    retries = 0
+
+    while total is None or position < total:
+        end = position + config.DIRECT_RANGE_SIZE - 1
+        if total:
+            end = min(end, total - 1)
+        requested = end - position + 1
+        received = 0
+        try:
+            async with client.stream("GET", fmt['url'], headers={**headers, "Range": f"bytes={position}-{end}"},
+                                     timeout=config.FRAGMENT_TIMEOUT) as response:
+                if response.status_code == 416:
+                    return  # the size was unknown and the last range ended exactly at the end
+                if response.status_code not in (200, 206):
+                    raise IOError(f"HTTP {response.status_code}")
+                if response.status_code == 200 and position:
+                    raise IOError("server ignored Range, cannot continue mid-file")
+                if response.status_code == 206 and total is None:
+                    match = CONTENT_RANGE_TOTAL.search(response.headers.get('content-range', ''))
+                    total = int(match.group(1)) if match else None
+                async for chunk in response.aiter_bytes(config.STREAM_CHUNK_SIZE):
+                    received += len(chunk)
+                    yield chunk
+                if response.status_code == 200:
+                    return
+        except Exception as e:
+            if received == 0 and retries >= config.YT_DLP_OPTIONS['fragment_retries']:
+                raise IOError(f"Direct download failed after {retries} retries: {e}")
+            retries = 0 if received else retries + 1
+            print(f"Direct download interrupted at byte {position + received}, resuming: {str(e)}")
+            await asyncio.sleep(config.FRAGMENT_RETRY_DELAY)
+            position += received
+            continue
+
+        position += received
+        if total is None and received < requested:
+            return  # short range: that was the end of the file
+
+
+async def pipe(cmd: List[str]) -> AsyncIterator[bytes]:
+    """Yield a subprocess's stdout in STREAM_CHUNK_SIZE reads; the process is killed on exit"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        while True:
+            chunk = await proc.stdout.read(config.STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
@@ -0,0 +1,150 @@
+"""
+Fragment streaming - concurrent HLS/DASH fragment fetching, in-order output
+Several fragments are downloaded at once (bounded per stream and across
+all streams) while bytes still leave in playlist order
+"""
+
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+import config
+from http_client import get_client
+
+FRAGMENT_PROTOCOLS = ('m3u8_native', 'm3u8', 'http_dash_segments')
+
+_global_slots: Optional[asyncio.Semaphore] = None
+
+
+def _slots() -> asyncio.Semaphore:
+    # Created on first use so it binds to the server's event loop
+    global _global_slots
+    if _global_slots is None:
+        _global_slots = asyncio.Semaphore(config.FRAGMENT_CONCURRENCY_GLOBAL)
+    return _global_slots
+
+
+def is_fragmented(fmt: Dict) -> bool:
+    return fmt.get('protocol') in FRAGMENT_PROTOCOLS
+
+
+def select_fragmented_format(info: Dict, quality: Optional[str]) -> Optional[Dict]:
+    """
+    Best muxed (audio+video) HLS/DASH format within the quality cap
+
+    Only returned when nothing else available under the cap is taller,
+    otherwise the video/audio merge path gives a better result.
+    """
+    max_height = int(quality) if quality and quality.isdigit() else None
+
+    def fits(f):
+        return f.get('vcodec') != 'none' and (max_height is None or (f.get('height') or 0) <= max_height)
+
+    candidates = [f for f in info.get('formats') or [] if fits(f)]
+    if not candidates:
+        return None
+
+    best_height = max(f.get('height') or 0 for f in candidates)
+    muxed = [
+        f for f in candidates
+        if is_fragmented(f) and f.get('acodec') not in (None, 'none') and (f.get('height') or 0) == best_height
+    ]
+    if not muxed:
+        return None
+    return max(muxed, key=lambda f: f.get('tbr') or 0)
+
+
+async def fragment_urls(fmt: Dict) -> Optional[Tuple[List[str], str]]:
+    """
+    Ordered fragment URLs of a format and the container they concatenate to
+    ("mp4" or "ts"), or None when it cannot be fetched here (encrypted,
+    byte-range or live HLS playlists are left to yt-dlp)
+    """
+    if fmt.get('protocol') == 'http_dash_segments':
+        base = fmt.get('fragment_base_url') or fmt.get('url') or ''
+        urls = []
+        for fragment in fmt.get('fragments') or []:
+            urls.append(fragment.get('url') or urljoin(base, fragment.get('path', '')))
+        return (urls, 'mp4') if urls else None
+
+    response = await get_client().get(fmt['url'], headers=fmt.get('http_headers'))
+    if response.status_code != 200:
+        return None
+    urls = parse_media_playlist(response.text, str(response.url))
+    if not urls:
+        return None
+    # fMP4 playlists declare an init segment; classic HLS is MPEG-TS
+    return urls, 'mp4' if '#EXT-X-MAP' in response.text else 'ts'
+
+
+def parse_media_playlist(text: str, playlist_url: str) -> Optional[List[str]]:
+    """Segment URLs of a finished, unencrypted HLS media playlist (init segment first)"""
+    if '#EXT-X-ENDLIST' not in text or '#EXT-X-BYTERANGE' in text:
+        return None
+
+    urls = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-KEY') and 'METHOD=NONE' not in line:
+            return None
+        if line.startswith('#EXT-X-MAP'):
+            if 'BYTERANGE' in line:
+                return None
+            uri = line.split('URI="', 1)[1].split('"', 1)[0]
+            urls.append(urljoin(playlist_url, uri))
+        elif line and not line.startswith('#'):
+            urls.append(urljoin(playlist_url, line))
+    return urls or None
+
+
+async def _fetch(url: str, headers: Optional[Dict]) -> bytes:
+    """One fragment with retries (yt-dlp's fragment_retries / skip_unavailable_fragments)"""
+    retries = config.YT_DLP_OPTIONS['fragment_retries']
+    delay = config.FRAGMENT_RETRY_DELAY
+
+    for attempt in range(retries + 1):
+        try:
+            async with _slots():
+                response = await get_client().get(url, headers=headers, timeout=config.FRAGMENT_TIMEOUT)
+            if response.status_code == 200:
+                return response.content
+            error = f"HTTP {response.status_code}"
+        except Exception as e:
+            error = str(e)
+
+        if attempt < retries:
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    if config.YT_DLP_OPTIONS['skip_unavailable_fragments']:
+        print(f"Skipping unavailable fragment {url}: {error}")
+        return b""
+    raise IOError(f"Fragment failed after {retries} retries: {error}")
+
+
+async def stream_fragments(urls: List[str], headers: Optional[Dict] = None,
+                           may_prefetch: Optional[Callable[[], bool]] = None) -> AsyncIterator[bytes]:
+    """
+    Yield fragment bodies in order while fetching ahead
+
+    At most FRAGMENT_CONCURRENCY_PER_STREAM fragments are in flight (or
+    buffered) for this stream; the global semaphore caps all streams.
+    may_prefetch, when given, can hold fetch-ahead back (memory pressure).
+    """
+    window = config.FRAGMENT_CONCURRENCY_PER_STREAM
+    pending: List[asyncio.Task] = []
+    next_index = 0
+
+    try:
+        while next_index < len(urls) or pending:
+            while next_index < len(urls) and len(pending) < window:
+                if pending and may_prefetch and not may_prefetch():
+                    break
+                pending.append(asyncio.create_task(_fetch(urls[next_index], headers)))
+                next_index += 1
+
+            data = await pending.pop(0)
+            if data:
+                yield data
+    finally:
+        for task in pending:
+            task.cancel()
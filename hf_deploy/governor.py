@@ -0,0 +1,180 @@
+"""
+Stream governor - shared memory and bandwidth budget for /api/stream
+Every active stream charges the bytes it has buffered against one global
+budget (readers wait when it is full) and sends at a weighted fair share
+of the total egress rate
+"""
+
+import asyncio
+import itertools
+import time
+from typing import AsyncIterator, Dict, Optional
+import config
+
+# Seconds of a stream's rate it may send in one burst
+BURST_SECONDS = 0.25
+
+
+class Stream:
+    """Accounting for one governed response"""
+
+    __slots__ = ('id', 'kind', 'label', 'weight', 'started', 'buffered', 'sent', 'tokens', 'refilled')
+
+    def __init__(self, stream_id: int, kind: str, label: str, weight: float):
+        self.id = stream_id
+        self.kind = kind
+        self.label = label
+        self.weight = weight
+        self.started = time.monotonic()
+        self.buffered = 0
+        self.sent = 0
+        self.tokens = 0.0
+        self.refilled = self.started
+
+
+class StreamGovernor:
+    """
+    Memory: chunks read from upstream are charged until they have been
+    handed to the client. A stream waits before reading further when its
+    own read-ahead (stream_buffer, or its slice of the budget) or the
+    global budget is used up; the budget can be exceeded by at most one
+    chunk per stream.
+
+    Bandwidth: with a total rate set, each stream gets
+    rate * weight / sum(weights of active streams) through a token bucket.
+    """
+
+    def __init__(self, memory_budget: int = config.GOVERNOR_MEMORY_BUDGET,
+                 stream_buffer: int = config.GOVERNOR_STREAM_BUFFER,
+                 bandwidth: int = config.GOVERNOR_BANDWIDTH):
+        self.memory_budget = memory_budget
+        self.stream_buffer = stream_buffer
+        self.bandwidth = bandwidth
+        self.streams: Dict[int, Stream] = {}
+        self.buffered = 0
+        self.memory_waits = 0
+        self._ids = itertools.count(1)
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _changed(self) -> asyncio.Condition:
+        # Created on first use so it binds to the server's event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def has_room(self) -> bool:
+        """Whether the global budget can take more read-ahead"""
+        return self.buffered < self.memory_budget
+
+    def _fits(self, stream: Stream, size: int) -> bool:
+        if stream.buffered == 0:
+            return True  # every stream may hold one chunk, so none starves
+        # Read-ahead is capped at an equal slice of the budget per stream
+        limit = min(self.stream_buffer, self.memory_budget // max(1, len(self.streams)))
+        return (self.buffered + size <= self.memory_budget
+                and stream.buffered + size <= limit)
+
+    async def _reserve(self, stream: Stream, size: int):
+        changed = self._changed()
+        async with changed:
+            if not self._fits(stream, size):
+                self.memory_waits += 1
+                await changed.wait_for(lambda: self._fits(stream, size))
+            stream.buffered += size
+            self.buffered += size
+
+    async def _release(self, stream: Stream, size: int):
+        changed = self._changed()
+        async with changed:
+            stream.buffered -= size
+            self.buffered -= size
+            changed.notify_all()
+
+    def share(self, stream: Stream) -> Optional[float]:
+        """Current bandwidth share of a stream in bytes/s (None when unlimited)"""
+        if not self.bandwidth:
+            return None
+        total_weight = sum(s.weight for s in self.streams.values()) or stream.weight
+        return self.bandwidth * stream.weight / total_weight
+
+    async def _throttle(self, stream: Stream, size: int):
+        """Token bucket at the stream's share; a large chunk puts the bucket in debt"""
+        rate = self.share(stream)
+        if not rate:
+            return
+        now = time.monotonic()
+        stream.tokens = min(rate * BURST_SECONDS, stream.tokens + (now - stream.refilled) * rate)
+        stream.refilled = now
+        if stream.tokens < 0:
+            await asyncio.sleep(-stream.tokens / rate)
+        stream.tokens -= size
+
+    async def govern(self, source: AsyncIterator[bytes], kind: str, label: str) -> AsyncIterator[bytes]:
+        """
+        Yield source's chunks under the governor
+
+        A producer task reads ahead into a queue as far as the memory budget
+        allows; chunks are released once the response has taken them.
+        """
+        stream = Stream(next(self._ids), kind, label, config.GOVERNOR_WEIGHTS.get(kind, 1))
+        self.streams[stream.id] = stream
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async for chunk in source:
+                    await self._reserve(stream, len(chunk))
+                    await queue.put(chunk)
+                await queue.put(None)
+            except Exception as e:
+                await queue.put(e)
+            finally:
+                await source.aclose()
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                await self._throttle(stream, len(chunk))
+                yield chunk
+                stream.sent += len(chunk)
+                await self._release(stream, len(chunk))
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            self.streams.pop(stream.id, None)
+            changed = self._changed()
+            async with changed:
+                self.buffered -= stream.buffered
+                stream.buffered = 0
+                changed.notify_all()
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        streams = []
+        for stream in self.streams.values():
+            age = max(now - stream.started, 1e-6)
+            streams.append({
+                "id": stream.id,
+                "kind": stream.kind,
+                "label": stream.label,
+                "weight": stream.weight,
+                "buffered_bytes": stream.buffered,
+                "sent_bytes": stream.sent,
+                "age_seconds": round(age, 1),
+                "average_rate": round(stream.sent / age),
+                "share_rate": self.share(stream),
+            })
+        return {
+            "active_streams": len(streams),
+            "buffered_bytes": self.buffered,
+            "memory_budget": self.memory_budget,
+            "stream_buffer": self.stream_buffer,
+            "bandwidth": self.bandwidth or None,
+            "memory_waits": self.memory_waits,
+            "streams": streams,
+        }
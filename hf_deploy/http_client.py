@@ -0,0 +1,46 @@
+"""
+Shared HTTP client
+One pooled httpx.AsyncClient for every upstream call, so repeat requests
+to the same host reuse warm TCP/TLS connections
+"""
+
+import time
+import cassette
+import config
+
+_client = None
+last_request_at = 0.0  # monotonic time of the last upstream request, pre-warm rounds excluded
+
+
+async def _note_request(request):
+    global last_request_at
+    if not request.extensions.get("prewarm"):
+        last_request_at = time.monotonic()
+
+
+def get_client():
+    """Return the process-wide pooled client (created on first use)"""
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+        limits = httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+        )
+        _client = httpx.AsyncClient(
+            timeout=config.TIMEOUT,
+            follow_redirects=True,
+            limits=limits,
+            # Record/replay when a cassette is active (None = normal network transport)
+            transport=cassette.httpx_transport(limits),
+            event_hooks={"request": [_note_request]},
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
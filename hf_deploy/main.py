@@ -1,14 +1,28 @@
 from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import yt_dlp
-import requests
+from cachetools import TTLCache
+from urllib.parse import urlencode
+import asyncio
+import hashlib
 import uvicorn
-import subprocess
-import shlex
+import config
+import cassette
+import audio
+import fragments
+import direct
+from governor import StreamGovernor
+from broadcast import BroadcastHub
+from http_client import get_client, close_client
+from prewarm import ConnectionWarmer
+
+# yt-dlp and requests are imported where they are used so that cold starts
+# and health checks do not pay for loading them
+
+# Record/replay upstream traffic when CASSETTE_MODE is set
+cassette.activate()
 
-import shlex
 try:
     import patch_dns
     patch_dns.patch()
@@ -17,16 +31,32 @@ except ImportError:
 
 app = FastAPI()
 
+# Memory and bandwidth shared by every /api/stream response
+governor = StreamGovernor()
+
+# One upstream fetch per unique stream, fanned out to every client
+broadcasts = BroadcastHub()
+
 @app.on_event("startup")
 async def startup_event():
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        ytdlp_version = version("yt-dlp")
+    except PackageNotFoundError:
+        ytdlp_version = "not installed"
     print("--------------------------------------------------")
     print("🚀 STARTUP: SHEROV BACKEND V6 (Invidious + Cobalt + yt-dlp)")
-    print(f"📦 yt-dlp version: {yt_dlp.version.__version__}")
+    print(f"📦 yt-dlp version: {ytdlp_version}")
     print("✅ YouTube: Invidious (cookie-free!)")
     print("✅ Others: Cobalt → yt-dlp fallback")
     print("--------------------------------------------------")
-    import patch_dns
-    patch_dns.patch()
+    if config.PREWARM_ENABLED:
+        connections.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await connections.stop()
+    await close_client()
 
 @app.get("/api/debug")
 async def debug_network():
@@ -83,49 +113,188 @@ app.add_middleware(
 class VideoRequest(BaseModel):
     url: str
 
+# yt-dlp info dicts by media key, shared by /api/download and /api/stream
+info_cache = TTLCache(maxsize=config.INFO_CACHE_SIZE, ttl=config.INFO_CACHE_TTL)
+
+# Cobalt audio URLs by media key (saves a Cobalt round trip per click)
+cobalt_audio_cache = TTLCache(maxsize=config.INFO_CACHE_SIZE, ttl=config.COBALT_URL_TTL)
+
+# Invidious instances tried in order for YouTube
+INVIDIOUS_INSTANCES = [
+    "https://invidious.io.lol",
+    "https://inv.nadeko.net",
+    "https://invidious.nerdvpn.de"
+]
+
+# Only the fields the preview needs; Invidious skips resolving formats for these
+INVIDIOUS_PREVIEW_FIELDS = "title,videoThumbnails,lengthSeconds,author"
+
+# Warm pooled connections to every Invidious instance and Cobalt
+connections = ConnectionWarmer(INVIDIOUS_INSTANCES + [config.COBALT_API_URL])
+
 @app.get("/api/stream")
-async def stream_video(url: str = Query(...), quality: str = Query(None), type: str = Query("video")):
-    # Determine yt-dlp path relative to venv
+async def stream_video(
+    url: str = Query(...),
+    quality: str = Query(None),
+    type: str = Query("video"),
+    codec: str = Query(config.AUDIO_DEFAULT_CODEC),
+    bitrate: int = Query(None)
+):
+    if type == "audio":
+        return await stream_audio(url, codec, bitrate)
+    
+    # Clients asking for the same video and quality share one upstream fetch
+    label = f"{media_key(url)} {quality or 'best'}"
+    source, media_type, headers = await broadcasts.stream(
+        f"video:{label}", lambda: open_video_source(url, quality)
+    )
+    return StreamingResponse(
+        governor.govern(source, "video", label),
+        media_type=media_type,
+        headers=headers
+    )
+
+async def open_video_source(url: str, quality: str = None):
+    """(chunks, media type, headers) of the best way to fetch url at quality."""
+    # One extraction for every way of fetching it; a URL that fails here fails fast
+    try:
+        info = await get_ytdlp_info(url)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Video extraction failed: {str(e)}")
+    
+    # Muxed HLS/DASH sources: fetch fragments concurrently in-process
+    fragmented = await fragmented_source(info, quality)
+    if fragmented:
+        fmt, urls, ext = fragmented
+        headers = {
+            "Content-Disposition": f'attachment; filename="video_{quality or "best"}.{ext}"'
+        }
+        media_type = "video/mp4" if ext == "mp4" else "video/mp2t"
+        source = fragments.stream_fragments(urls, fmt.get('http_headers'), may_prefetch=governor.has_room)
+        return source, media_type, headers
+    
+    # Plain HTTP formats of the cached extraction: relayed, or muxed by ffmpeg
+    chosen = direct.select_formats(info, quality)
+    if chosen:
+        if len(chosen) == 1:
+            fmt = chosen[0]
+            source = direct.relay(fmt)
+            ext = fmt.get('ext') or 'mp4'
+            media_type = f"video/{ext}"
+        else:
+            source = direct.pipe(direct.mux_command(*chosen))
+            _, ext, media_type = direct.container(*chosen)
+        headers = {
+            "Content-Disposition": f'attachment; filename="video_{quality or "best"}.{ext}"'
+        }
+        return source, media_type, headers
+    
+    # Last resort: yt-dlp downloads it itself (protocols handled nowhere else)
     import sys
-    import os
     
     # Use python -m yt_dlp to avoid path issues on Linux/Docker
     # This works because yt-dlp is installed as a python package
     
     # Build yt-dlp command to stream to stdout
-    cmd = [sys.executable, "-m", "yt_dlp", url, "-o", "-", "--quiet", "--no-warnings", "--force-ipv4"]
+    cmd = [sys.executable, "-m", "yt_dlp", "-o", "-", "--quiet", "--no-warnings", "--force-ipv4"]
     
-    if type == "audio":
-        cmd.extend(["-f", "bestaudio/best", "-x", "--audio-format", "mp3"])
-        filename = "audio.mp3"
-        media_type = "audio/mpeg"
+    # Fragmented sources yt-dlp handles itself still fetch several fragments at once
+    cmd.extend([
+        "--concurrent-fragments", str(config.FRAGMENT_CONCURRENCY_PER_STREAM),
+        "--fragment-retries", str(config.YT_DLP_OPTIONS['fragment_retries']),
+    ])
+    
+    # Video
+    if quality:
+        cmd.extend(["-f", f"bestvideo[height<={quality}]+bestaudio/best[height<={quality}]"])
     else:
-        # Video
-        if quality:
-            cmd.extend(["-f", f"bestvideo[height<={quality}]+bestaudio/best[height<={quality}]"])
-        else:
-            cmd.extend(["-f", "bestvideo+bestaudio/best"])
-        
-        filename = f"video_{quality or 'best'}.mp4"
-        media_type = "video/mp4"
-
-    # streaming generator
-    def iterfile():
-        # Use subprocess to capture stdout
-        # Note: In production, consider using asyncio subprocess
-        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=10**8) as proc:
-            while True:
-                chunk = proc.stdout.read(4096)
-                if not chunk:
-                    break
-                yield chunk
+        cmd.extend(["-f", "bestvideo+bestaudio/best"])
+    
+    # "--" so a url starting with "-" can never be read as an option
+    cmd.extend(["--", url])
     
+    filename = f"video_{quality or 'best'}.mp4"
     headers = {
         "Content-Disposition": f'attachment; filename="{filename}"'
     }
     
+    # The pipe is read in small chunks so buffered bytes stay within the governor's budget
+    return direct.pipe(cmd), "video/mp4", headers
+
+async def fragmented_source(info: dict, quality: str = None):
+    """(format, fragment URLs, container) when the video is best served as fetched fragments."""
+    try:
+        fmt = fragments.select_fragmented_format(info, quality)
+        if not fmt:
+            return None
+        resolved = await fragments.fragment_urls(fmt)
+    except Exception as e:
+        print(f"Fragment source lookup failed, using yt-dlp: {str(e)}")
+        return None
     
-    return StreamingResponse(iterfile(), media_type=media_type, headers=headers)
+    if not resolved:
+        return None
+    urls, ext = resolved
+    return fmt, urls, ext
+
+async def stream_audio(url: str, codec: str, bitrate: int = None):
+    """
+    Audio download through the ffmpeg pipeline.
+    Finished files are served from the audio cache; otherwise the best audio
+    format of the cached extraction is transcoded (or stream-copied) on the fly.
+    """
+    if codec not in config.AUDIO_CODECS:
+        raise HTTPException(status_code=400, detail=f"Unsupported codec. Use one of: {', '.join(config.AUDIO_CODECS)}")
+    
+    # m4a without an explicit bitrate keeps the source bitrate (stream copy)
+    if bitrate or codec != 'm4a':
+        bitrate = audio.snap_bitrate(bitrate)
+    
+    _, _, ext, media_type = config.AUDIO_CODECS[codec]
+    key = media_key(url)
+    filename = f"audio_{bitrate or 'source'}.{ext}"
+    
+    cached = audio.cached_file(key, codec, bitrate) or (codec == 'm4a' and (
+        audio.cached_file(key, codec, None)
+        # a non-AAC source transcoded at the default bitrate
+        or (not bitrate and audio.cached_file(key, codec, config.AUDIO_DEFAULT_BITRATE))
+    ))
+    if cached:
+        return FileResponse(cached, media_type=media_type, filename=filename)
+    
+    async def open_source():
+        try:
+            info = await get_ytdlp_info(url)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Audio extraction failed: {str(e)}")
+        
+        fmt = audio.best_audio_format(info, codec)
+        if not fmt:
+            raise HTTPException(status_code=400, detail="No audio format available for this video")
+        
+        headers = {
+            "Content-Disposition": f'attachment; filename="{filename}"'
+        }
+        return audio.stream_audio(key, fmt, codec, bitrate), media_type, headers
+    
+    # One ffmpeg per video, codec and bitrate, however many clients want it
+    label = f"{key} {codec} {bitrate or 'source'}"
+    source, media_type, headers = await broadcasts.stream(f"audio:{label}", open_source)
+    return StreamingResponse(
+        governor.govern(source, "audio", label),
+        media_type=media_type,
+        headers=headers
+    )
+
+@app.get("/api/streams")
+async def stream_usage():
+    """Active streams with their buffered bytes, bytes sent and bandwidth share, and live broadcasts."""
+    return {**governor.stats(), "broadcasts": broadcasts.stats()}
+
+@app.get("/api/connections")
+async def connection_report():
+    """Per-host DNS, TCP and TLS setup times and connections reused by the last keep-alive round."""
+    return connections.stats()
 
 @app.get("/")
 async def health_check():
@@ -134,8 +303,19 @@ async def health_check():
 @app.get("/api/cobalt-audio")
 async def cobalt_audio(url: str = Query(...)):
     """Get audio-only download URL using Cobalt API."""
+    
+    key = media_key(url)
+    
+    # Already transcoded by the audio pipeline
+    cached = audio.cached_file(key, 'mp3', 320)
+    if cached:
+        return FileResponse(cached, media_type="audio/mpeg", filename="audio_320.mp3")
+    
+    if key in cobalt_audio_cache:
+        return RedirectResponse(url=cobalt_audio_cache[key])
+    
     try:
-        cobalt_url = "https://api.cobalt.tools/"
+        cobalt_url = config.COBALT_API_URL
         headers = {
             "Accept": "application/json",
             "Content-Type": "application/json"
@@ -147,7 +327,7 @@ async def cobalt_audio(url: str = Query(...)):
             "audioBitrate": "320"
         }
         
-        response = requests.post(cobalt_url, json=payload, headers=headers, timeout=15)
+        response = await get_client().post(cobalt_url, json=payload, headers=headers, timeout=15)
         
         if response.status_code != 200:
             raise HTTPException(status_code=400, detail=f"Cobalt API error: {response.status_code}")
@@ -163,7 +343,7 @@ async def cobalt_audio(url: str = Query(...)):
             raise HTTPException(status_code=400, detail="No download URL from Cobalt")
         
         # Redirect to the audio file
-        from fastapi.responses import RedirectResponse
+        cobalt_audio_cache[key] = download_url
         return RedirectResponse(url=download_url)
         
     except Exception as e:
@@ -219,16 +399,144 @@ async def extract_video_info(video_request: VideoRequest, request: Request):
                     )
             raise
 
+def youtube_video_id(url: str):
+    """Extract the video ID from a youtu.be or youtube.com/watch URL."""
+    if "youtu.be/" in url:
+        return url.split("youtu.be/")[1].split("?")[0]
+    if "youtube.com/watch?v=" in url:
+        return url.split("v=")[1].split("&")[0]
+    return None
+
+def media_key(url: str) -> str:
+    """Stable per-video key: the YouTube ID, or a hash of the cleaned URL."""
+    clean_url = url.strip()
+    if '?si=' in clean_url or '&si=' in clean_url:
+        clean_url = clean_url.split('?si=')[0].split('&si=')[0]
+    video_id = youtube_video_id(clean_url)
+    if video_id:
+        return f"youtube-{video_id}"
+    return hashlib.sha1(clean_url.encode()).hexdigest()[:16]
+
+def ytdlp_options():
+    """yt-dlp options plus cookies when a cookies.txt is present."""
+    import os
+    
+    ydl_opts = config.YT_DLP_OPTIONS.copy()
+    if os.path.exists(config.COOKIE_PATH):
+        ydl_opts['cookiefile'] = config.COOKIE_PATH
+        print(f"Using cookies from {config.COOKIE_PATH}")
+    else:
+        print("WARNING: No cookies.txt found. YouTube may require authentication.")
+    return ydl_opts
+
+def _extract_ytdlp_info(url: str):
+    import yt_dlp
+    
+    def extract():
+        with yt_dlp.YoutubeDL(ytdlp_options()) as ydl:
+            return ydl.extract_info(url, download=False)
+    
+    return cassette.ytdlp_info(url, extract)
+
+async def get_ytdlp_info(url: str):
+    """yt-dlp info dict for url, from the info cache or a fresh in-process extraction."""
+    key = media_key(url)
+    if key in info_cache:
+        return info_cache[key]
+    
+    info = await asyncio.to_thread(_extract_ytdlp_info, url)
+    
+    if not info:
+        raise ValueError("Could not extract video info")
+    
+    if info.get('_type') in ('playlist', 'multi_video'):
+        raise ValueError("Playlists and channels are not supported; paste a single video link")
+    
+    info_cache[key] = info
+    return info
+
+@app.post("/api/preview")
+async def preview_video_info(video_request: VideoRequest):
+    """
+    Fast metadata preview: title, thumbnail and duration only.
+    Formats are resolved afterwards through /api/download.
+    """
+    import asyncio
+    
+    clean_url = video_request.url
+    if '?si=' in clean_url or '&si=' in clean_url:
+        clean_url = clean_url.split('?si=')[0].split('&si=')[0]
+    
+    video_id = youtube_video_id(clean_url)
+    if video_id:
+        preview = await preview_with_invidious(video_id)
+        if preview:
+            return preview
+    
+    try:
+        return await asyncio.to_thread(preview_with_ytdlp, clean_url)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Preview failed: {str(e)}")
+
+async def preview_with_invidious(video_id: str):
+    """Preview from the Invidious fields subset (no format resolution)."""
+    for instance in INVIDIOUS_INSTANCES:
+        try:
+            response = await get_client().get(
+                f"{instance}/api/v1/videos/{video_id}",
+                params={"fields": INVIDIOUS_PREVIEW_FIELDS},
+                timeout=5
+            )
+            if response.status_code != 200:
+                continue
+            data = response.json()
+            thumbnails = data.get('videoThumbnails') or []
+            return {
+                "title": data.get('title', 'Unknown'),
+                "thumbnail": thumbnails[0].get('url') if thumbnails else None,
+                "platform": "YouTube",
+                "duration": str(data.get('lengthSeconds', 0)) + "s",
+                "formats": [],
+                "formats_pending": True
+            }
+        except Exception as e:
+            print(f"Invidious preview ({instance}) failed: {str(e)}")
+    return None
+
+def preview_with_ytdlp(url: str):
+    """Preview from unprocessed yt-dlp info (skips format selection)."""
+    import yt_dlp
+    
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True,
+        'noplaylist': True,
+        'socket_timeout': 10,
+        'force_ipv4': True,
+    }
+    def extract():
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            return ydl.extract_info(url, download=False, process=False)
+    
+    info = cassette.ytdlp_info(url, extract, variant="preview")
+    
+    if not info:
+        raise ValueError("Could not extract video info")
+    
+    duration = info.get('duration')
+    return {
+        "title": info.get('title', 'Unknown'),
+        "thumbnail": info.get('thumbnail'),
+        "platform": info.get('extractor_key', 'Unknown'),
+        "duration": f"{int(duration)}s" if duration else None,
+        "formats": [],
+        "formats_pending": True
+    }
+
 async def extract_with_invidious(url: str, request: Request):
     """Extract video info using Invidious API (YouTube only, cookie-free)."""
-    import re
-    
-    # Extract video ID from URL
-    video_id = None
-    if "youtu.be/" in url:
-        video_id = url.split("youtu.be/")[1].split("?")[0]
-    elif "youtube.com/watch?v=" in url:
-        video_id = url.split("v=")[1].split("&")[0]
+    video_id = youtube_video_id(url)
     
     if not video_id:
         raise ValueError("Could not extract YouTube video ID")
@@ -236,19 +544,13 @@ async def extract_with_invidious(url: str, request: Request):
     print(f"Extracted video ID: {video_id}")
     
     # Try multiple Invidious instances for reliability
-    instances = [
-        "https://invidious.io.lol",
-        "https://inv.nadeko.net",
-        "https://invidious.nerdvpn.de"
-    ]
-    
     last_error = None
-    for instance in instances:
+    for instance in INVIDIOUS_INSTANCES:
         try:
             invidious_url = f"{instance}/api/v1/videos/{video_id}"
             print(f"Trying Invidious instance: {instance}")
             
-            response = requests.get(invidious_url, timeout=10)
+            response = await get_client().get(invidious_url, timeout=10)
             
             if response.status_code != 200:
                 last_error = f"{instance} returned {response.status_code}"
@@ -306,9 +608,7 @@ async def extract_with_invidious(url: str, request: Request):
 
 async def extract_with_cobalt(url: str, request: Request):
     """Extract video info using Cobalt API."""
-    import requests
-    
-    cobalt_url = "https://api.cobalt.tools/"
+    cobalt_url = config.COBALT_API_URL
     headers = {
         "Accept": "application/json",
         "Content-Type": "application/json"
@@ -320,7 +620,7 @@ async def extract_with_cobalt(url: str, request: Request):
         "filenameStyle": "basic"
     }
     
-    response = requests.post(cobalt_url, json=payload, headers=headers, timeout=15)
+    response = await get_client().post(cobalt_url, json=payload, headers=headers, timeout=15)
     
     if response.status_code != 200:
         try:
@@ -375,7 +675,7 @@ async def extract_with_cobalt(url: str, request: Request):
             "label": "Audio Only",
             "quality": "audio",
             "file_size": None,
-            "url": f"{base_url}/api/cobalt-audio?url={url}",
+            "url": f"{base_url}/api/cobalt-audio?{urlencode({'url': url})}",
             "ext": "mp3"
         }
     ]
@@ -390,60 +690,35 @@ async def extract_with_cobalt(url: str, request: Request):
 
 async def extract_with_ytdlp(url: str, request: Request):
     """Extract video info using yt-dlp (fallback)."""
-    import os
-    
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'format': 'best',
-        'nocheckcertificate': True,
-        'ignoreerrors': True,
-        'no_color': True,
-        'socket_timeout': 30,
-        'force_ipv4': True,
-    }
+    info = await get_ytdlp_info(url)
     
-    # Add cookies if file exists
-    cookie_path = '/home/user/app/cookies.txt'
-    if os.path.exists(cookie_path):
-        ydl_opts['cookiefile'] = cookie_path
-        print(f"Using cookies from {cookie_path}")
-    else:
-        print("WARNING: No cookies.txt found. YouTube may require authentication.")
+    base_url = str(request.base_url).rstrip('/')
     
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=False)
-        
-        if not info:
-            raise ValueError("Could not extract video info")
-        
-        base_url = str(request.base_url).rstrip('/')
-        
-        # Simple format extraction
-        formats = [
-            {
-                "label": "Best Quality (yt-dlp)",
-                "quality": "hd",
-                "file_size": None,
-                "url": f"{base_url}/api/stream?url={url}&type=video",
-                "ext": "mp4"
-            },
-            {
-                "label": "Audio Only",
-                "quality": "audio",
-                "file_size": None,
-                "url": f"{base_url}/api/stream?url={url}&type=audio",
-                "ext": "mp3"
-            }
-        ]
-        
-        return {
-            "title": info.get('title', 'Unknown'),
-            "thumbnail": info.get('thumbnail'),
-            "platform": info.get('extractor_key', 'Unknown'),
-            "duration": info.get('duration_string'),
-            "formats": formats
+    # Simple format extraction
+    formats = [
+        {
+            "label": "Best Quality (yt-dlp)",
+            "quality": "hd",
+            "file_size": None,
+            "url": f"{base_url}/api/stream?{urlencode({'url': url, 'type': 'video'})}",
+            "ext": "mp4"
+        },
+        {
+            "label": "Audio Only",
+            "quality": "audio",
+            "file_size": None,
+            "url": f"{base_url}/api/stream?{urlencode({'url': url, 'type': 'audio'})}",
+            "ext": "mp3"
         }
+    ]
+    
+    return {
+        "title": info.get('title', 'Unknown'),
+        "thumbnail": info.get('thumbnail'),
+        "platform": info.get('extractor_key', 'Unknown'),
+        "duration": info.get('duration_string'),
+        "formats": formats
+    }
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
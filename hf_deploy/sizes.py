@@ -0,0 +1,99 @@
+"""
+File sizes - formatting and probing
+Format URLs without a known size get a HEAD (or a one-byte Range GET
+when HEAD says nothing useful) on the pooled client, all at once and
+within a small time budget
+"""
+
+import asyncio
+import re
+from typing import Dict, List, Optional
+import config
+from http_client import get_client
+
+# "bytes 0-0/123456" -> 123456
+CONTENT_RANGE_TOTAL = re.compile(r'/(\d+)\s*$')
+
+# Manifests: their own size says nothing about the media
+MANIFEST_MARKERS = ('.m3u8', '.mpd', 'mpegurl', 'dash+xml')
+
+
+def format_size(bytes_val) -> Optional[str]:
+    """Bytes to a human-readable size ("12.3 MB")"""
+    if not bytes_val:
+        return None
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if bytes_val < 1024.0:
+            return f"{bytes_val:.1f} {unit}"
+        bytes_val /= 1024.0
+    return f"{bytes_val:.1f} TB"
+
+
+def _needs_probe(fmt: Dict) -> bool:
+    url = fmt.get('url') or ''
+    if not url.startswith(('http://', 'https://')):
+        return False
+    if fmt.get('video_only'):
+        return False  # the URL's size leaves out the audio the listed size includes
+    if fmt.get('file_size') and not fmt.get('size_estimated'):
+        return False
+    return not any(marker in url for marker in MANIFEST_MARKERS)
+
+
+def _is_manifest(response) -> bool:
+    content_type = response.headers.get('content-type', '')
+    return any(marker in content_type for marker in MANIFEST_MARKERS)
+
+
+async def probe_size(url: str, timeout: float) -> Optional[int]:
+    """Exact byte size of url, None if the server will not tell"""
+    client = get_client()
+    
+    response = await client.head(url, timeout=timeout)
+    length = response.headers.get('content-length')
+    if response.status_code == 200 and length and length.isdigit() and int(length) > 0:
+        return None if _is_manifest(response) else int(length)
+    
+    # Many CDNs and tunnels do not answer HEAD; one byte of a GET does the job
+    async with client.stream("GET", url, headers={"Range": "bytes=0-0"}, timeout=timeout) as response:
+        if _is_manifest(response):
+            return None
+        if response.status_code == 206:
+            match = CONTENT_RANGE_TOTAL.search(response.headers.get('content-range', ''))
+            return int(match.group(1)) if match else None
+        length = response.headers.get('content-length')
+        if response.status_code == 200 and length and length.isdigit():
+            return int(length)
+    return None
+
+
+async def enrich_sizes(formats: List[Dict], budget: float = config.SIZE_PROBE_BUDGET) -> int:
+    """
+    Probe formats concurrently and fill in exact file_size values in place;
+    returns how many were filled
+    
+    Probes still running when the budget ends are cancelled and their
+    formats keep whatever size they had.
+    """
+    targets = [f for f in formats if _needs_probe(f)][:config.SIZE_PROBE_MAX_FORMATS]
+    if not targets or budget <= 0:
+        return 0
+    
+    probes = {asyncio.create_task(probe_size(f['url'], budget)): f for f in targets}
+    done, pending = await asyncio.wait(probes, timeout=budget)
+    for task in pending:
+        task.cancel()
+    
+    filled = 0
+    for task in done:
+        if task.exception():
+            continue
+        size = task.result()
+        if size:
+            fmt = probes[task]
+            fmt['file_size'] = format_size(size)
+            fmt['size_estimated'] = False
+            filled += 1
+    
+    print(f"✓ Probed sizes: {filled}/{len(targets)} filled" + (f", {len(pending)} timed out" if pending else ""))
+    return filled
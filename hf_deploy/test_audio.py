@@ -0,0 +1,42 @@
+"""
+Offline checks for the audio pipeline (no network, no ffmpeg run)
+
+    python -m pytest test_audio.py
+"""
+
+import asyncio
+import os
+import config
+import audio
+
+OPUS = {'format_id': '251', 'url': 'https://cdn.test/251', 'protocol': 'https',
+        'vcodec': 'none', 'acodec': 'opus', 'abr': 160}
+AAC = {'format_id': '140', 'url': 'https://cdn.test/140', 'protocol': 'https',
+       'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 129}
+
+
+def test_opus_source_to_m4a_without_bitrate():
+    assert not audio.can_stream_copy(OPUS, 'm4a', None)
+    cmd = audio.build_command(OPUS, 'm4a', None, copy=False)
+    bitrate = cmd[cmd.index("-b:a") + 1]
+    assert bitrate == f"{config.AUDIO_DEFAULT_BITRATE}k"
+    assert "None" not in " ".join(cmd)
+
+
+def test_opus_source_to_m4a_cached_at_default_bitrate(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "AUDIO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "FFMPEG_PATH", "echo")  # prints the arguments and exits 0
+
+    async def run():
+        return b"".join([chunk async for chunk in audio.stream_audio("key", OPUS, 'm4a', None)])
+
+    output = asyncio.run(run())
+    assert f"-b:a {config.AUDIO_DEFAULT_BITRATE}k".encode() in output
+    assert os.listdir(tmp_path) == [f"key-{config.AUDIO_DEFAULT_BITRATE}k.m4a"]
+
+
+def test_m4a_prefers_aac_source():
+    info = {'formats': [AAC, OPUS]}
+    assert audio.best_audio_format(info, 'm4a') is AAC
+    assert audio.best_audio_format(info, 'mp3') is OPUS
+    assert audio.can_stream_copy(AAC, 'm4a', None)
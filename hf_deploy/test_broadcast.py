@@ -0,0 +1,83 @@
+"""
+Offline checks for shared streams (no network)
+
+    python -m pytest test_broadcast.py
+"""
+
+import asyncio
+import os
+from broadcast import BroadcastHub
+
+CHUNK = 1000
+
+
+def expected(n):
+    return b"".join(bytes([i % 256]) * CHUNK for i in range(n))
+
+
+def opener(n, counter):
+    async def chunks():
+        for i in range(n):
+            await asyncio.sleep(0.002)
+            yield bytes([i % 256]) * CHUNK
+
+    async def open_source():
+        counter.append(1)
+        await asyncio.sleep(0.01)
+        return chunks(), "video/mp4", {}
+    return open_source
+
+
+async def consume(chunks, delay=0.0):
+    out = b""
+    async for chunk in chunks:
+        out += chunk
+        if delay:
+            await asyncio.sleep(delay)
+    return out
+
+
+def hub_in(tmp_path, **kwargs):
+    return BroadcastHub(directory=str(tmp_path), disk_budget=10 ** 9, linger=0.05,
+                        join_window=20 * CHUNK, spill_cap=30 * CHUNK, **kwargs)
+
+
+def test_single_reader_never_touches_disk(tmp_path):
+    async def run():
+        hub, opens = hub_in(tmp_path), []
+        chunks, _, _ = await hub.stream("solo", opener(50, opens))
+        assert await consume(chunks) == expected(50)
+        assert hub.stats()["spill_files"] == 0
+
+    asyncio.run(run())
+    assert os.listdir(tmp_path) == []
+
+
+def test_joiners_share_one_fetch_through_a_capped_ring(tmp_path):
+    async def run():
+        hub, opens = hub_in(tmp_path), []
+        fast, _, _ = await hub.stream("k", opener(100, opens))
+        slow, _, _ = await hub.stream("k", opener(100, opens))
+        assert hub.live["k"].spilled
+        outputs = await asyncio.gather(consume(fast), consume(slow, delay=0.005))
+        assert outputs == [expected(100)] * 2
+        assert len(opens) == 1
+        assert all(os.path.getsize(os.path.join(tmp_path, name)) <= 30 * CHUNK
+                   for name in os.listdir(tmp_path))
+        await asyncio.sleep(0.2)  # linger, then the spill file goes
+        assert hub.stats()["spill_files"] == 0
+
+    asyncio.run(run())
+    assert os.listdir(tmp_path) == []
+
+
+def test_over_budget_joiner_goes_unshared(tmp_path):
+    async def run():
+        hub, opens = hub_in(tmp_path), []
+        hub.disk_budget = 0
+        first, _, _ = await hub.stream("u", opener(10, opens))
+        second, _, _ = await hub.stream("u", opener(10, opens))
+        assert await asyncio.gather(consume(first), consume(second)) == [expected(10)] * 2
+        assert len(opens) == 2 and hub.unshared == 1
+
+    asyncio.run(run())